@@ -0,0 +1,384 @@
+"""
+Load test of the frame server against fake rovers, PayCaster and Warpcast
+
+From the root of this repository:
+
+    PYTHONPATH=. python dev/bench.py --save dev/bench_baseline.json
+    # ... change something ...
+    PYTHONPATH=. python dev/bench.py --compare dev/bench_baseline.json
+
+The fakes and the frame server are started on free local ports, with a
+fresh database, then each scenario drives its flow with `--concurrency`
+clients for `--duration` seconds. Latency percentiles and throughput are
+reported per route, and compared with a saved run when asked to.
+"""
+
+import argparse
+import asyncio
+from collections import defaultdict
+import json
+import os
+from pathlib import Path
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import uuid
+
+import httpx
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+APP_DIR = ROOT_DIR / "fastapi-frames-server"
+
+PERCENTILES = (50, 95, 99)
+# Any mnemonic will do, the fake Warpcast does not check the signature
+MNEMONIC = "test test test test test test test test test test test junk"
+MOVE_BURST = ("forward", "left", "right", "backward", "stop")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    """Nearest rank percentile of sorted values"""
+    if not ordered:
+        return 0.0
+    rank = max(1, round(p / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class Samples:
+    __slots__ = ("latencies", "errors")
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+
+    def summary(self, elapsed: float) -> Dict:
+        ordered = sorted(self.latencies)
+        summary = {
+            "requests": len(ordered),
+            "errors": self.errors,
+            "throughput": len(ordered) / elapsed if elapsed else 0.0,
+        }
+        for p in PERCENTILES:
+            summary[f"p{p}"] = percentile(ordered, p)
+        return summary
+
+
+class Bench:
+    """Shared state of the scenarios: the client, the rovers and the samples"""
+
+    def __init__(self, client: httpx.AsyncClient, rovers: List[str], fids: int):
+        self.client = client
+        self.rovers = rovers
+        self.fids = fids
+        self.samples: Dict[str, Samples] = defaultdict(Samples)
+        self.transactions: List[str] = []
+
+    def rover(self) -> str:
+        return random.choice(self.rovers)
+
+    def fid(self) -> int:
+        return random.randint(1, self.fids)
+
+    async def request(self, route: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        samples = self.samples[route]
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            samples.latencies.append(time.perf_counter() - start)
+            samples.errors += 1
+            return None
+        samples.latencies.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            samples.errors += 1
+        return response
+
+    async def callback(self, rover_id: str, transaction_id: str, fid: int):
+        await self.request(
+            "POST /callback/{rover_id}",
+            "POST",
+            f"/callback/{rover_id}",
+            json={"untrustedData": {"transactionId": transaction_id, "fid": fid}},
+        )
+
+    async def start_sessions(self):
+        """Pay for every rover, so that the control routes have a session"""
+        for rover_id in self.rovers:
+            await self.callback(rover_id, f"0x{uuid.uuid4().hex}", self.fid())
+
+
+# Scenarios, each call is one iteration of a client
+
+
+async def select(bench: Bench):
+    """A user picks a rover: username lookup, then the PayCaster frame"""
+    await bench.request(
+        "POST /v1/select_rover/{rover_id}",
+        "POST",
+        f"/v1/select_rover/{bench.rover()}",
+        data={"fid": str(bench.fid())},
+    )
+
+
+async def callback(bench: Bench):
+    """Payment callbacks, one in five being a retry of an earlier one"""
+    if bench.transactions and random.random() < 0.2:
+        transaction_id = random.choice(bench.transactions)
+    else:
+        transaction_id = f"0x{uuid.uuid4().hex}"
+        bench.transactions.append(transaction_id)
+    await bench.callback(bench.rover(), transaction_id, bench.fid())
+
+
+async def move(bench: Bench):
+    """A burst of clicks on the direction buttons, ending with a stop"""
+    rover_id = bench.rover()
+    for direction in MOVE_BURST:
+        await bench.request(
+            "POST /v1/rover/{rover_id}/move/{direction}",
+            "POST",
+            f"/v1/rover/{rover_id}/move/{direction}",
+        )
+
+
+async def pic(bench: Bench):
+    await bench.request(
+        "POST /v1/rover/{rover_id}/pic", "POST", f"/v1/rover/{bench.rover()}/pic"
+    )
+
+
+async def transactions(bench: Bench):
+    await bench.request("GET /transactions", "GET", "/transactions")
+
+
+SCENARIOS: Dict[str, Callable[[Bench], asyncio.Future]] = {
+    "select": select,
+    "callback": callback,
+    "move": move,
+    "pic": pic,
+    "transactions": transactions,
+}
+
+
+async def run_scenario(bench: Bench, scenario, duration: float, concurrency: int) -> float:
+    deadline = time.monotonic() + duration
+
+    async def client():
+        while time.monotonic() < deadline:
+            await scenario(bench)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def run(url: str, rovers: List[str], args) -> Dict[str, Dict]:
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=url, timeout=30.0, limits=limits) as client:
+        # The server warms up in the background once started, let it finish
+        # so that the first scenario is not measuring it
+        warm_up = Bench(client, rovers, args.fids)
+        await asyncio.gather(*(select(warm_up) for _ in rovers))
+        for name in args.scenarios:
+            bench = Bench(client, rovers, args.fids)
+            if name in ("move", "pic"):
+                await bench.start_sessions()
+                bench.samples.clear()
+            print(f"Running {name} for {args.duration:g}s...", file=sys.stderr)
+            elapsed = await run_scenario(bench, SCENARIOS[name], args.duration, args.concurrency)
+            for route, samples in bench.samples.items():
+                results[f"{name}: {route}"] = samples.summary(elapsed)
+    return results
+
+
+def report(results: Dict[str, Dict], baseline: Optional[Dict[str, Dict]] = None):
+    columns = ["requests", "errors", "throughput"] + [f"p{p}" for p in PERCENTILES]
+    width = max(len(route) for route in results)
+    print(f"{'route':<{width}}  {'requests':>8} {'errors':>6} {'req/s':>8}"
+          + "".join(f" {f'p{p} ms':>9}" for p in PERCENTILES))
+    for route, summary in results.items():
+        line = (
+            f"{route:<{width}}  {summary['requests']:>8} {summary['errors']:>6}"
+            f" {summary['throughput']:>8.1f}"
+            + "".join(f" {summary[f'p{p}'] * 1000:>9.1f}" for p in PERCENTILES)
+        )
+        print(line)
+        previous = (baseline or {}).get(route)
+        if previous:
+            changes = []
+            for column in columns[2:]:
+                if previous[column]:
+                    change = (summary[column] - previous[column]) / previous[column] * 100
+                    changes.append(f"{column} {change:+.0f}%")
+            print(f"{'':<{width}}  vs baseline: " + ", ".join(changes))
+
+
+class Services:
+    """The fakes and the frame server, as child processes"""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = Path(tempfile.mkdtemp(prefix="tumbller-bench-"))
+        self.processes: List[subprocess.Popen] = []
+
+    def spawn(self, name: str, app: str, port: int, env: Dict[str, str], app_dir: Path = ROOT_DIR):
+        log = open(self.workdir / f"{name}.log", "w")
+        self.processes.append(
+            subprocess.Popen(
+                [
+                    sys.executable, "-m", "uvicorn", app,
+                    "--app-dir", str(app_dir),
+                    "--port", str(port),
+                    "--log-level", "warning",
+                ],
+                cwd=self.workdir,
+                env={**os.environ, "PYTHONPATH": str(ROOT_DIR), **env},
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+        )
+        return f"http://127.0.0.1:{port}"
+
+    def start(self) -> Tuple[str, List[str]]:
+        args = self.args
+        rover_url = self.spawn(
+            "fake_rover",
+            "dev.fake_rover:app",
+            free_port(),
+            {
+                "FAKE_ROVER_LATENCY": str(args.rover_latency),
+                "FAKE_ROVER_JITTER": str(args.rover_jitter),
+                "FAKE_ROVER_FAILURE_RATE": str(args.rover_failure_rate),
+            },
+        )
+        services_url = self.spawn(
+            "fake_services",
+            "dev.fake_services:app",
+            free_port(),
+            {
+                "FAKE_PAYCASTER_LATENCY": str(args.paycaster_latency),
+                "FAKE_PAYCASTER_JITTER": str(args.paycaster_jitter),
+                "FAKE_PAYCASTER_FAILURE_RATE": str(args.paycaster_failure_rate),
+                "FAKE_WARPCAST_LATENCY": str(args.warpcast_latency),
+                "FAKE_WARPCAST_JITTER": str(args.warpcast_jitter),
+                "FAKE_WARPCAST_FAILURE_RATE": str(args.warpcast_failure_rate),
+            },
+        )
+        self.wait(rover_url + "/docs")
+        self.wait(services_url + "/docs")
+
+        rovers = [chr(ord("A") + i) if args.rovers <= 26 else f"R{i + 1}" for i in range(args.rovers)]
+        fleet_file = self.workdir / "fleet.json"
+        fleet_file.write_text(
+            json.dumps(
+                [
+                    {
+                        "id": rover_id,
+                        "camera_url": f"{rover_url}/cameras/{rover_id.lower()}",
+                        "motor_url": f"{rover_url}/tumbllers/{rover_id.lower()}",
+                        # Long enough for the sessions to outlive the run
+                        "session_duration": 3600,
+                    }
+                    for rover_id in rovers
+                ]
+            )
+        )
+        port = free_port()
+        server_env = {
+            "ENVIRONMENT": "development",
+            "DEBUG": "False",
+            "FQDN": f"127.0.0.1:{port}",
+            "BASE_URL": f"http://127.0.0.1:{port}",
+            "FARCASTER_HOSTED_MANIFEST_URL": "http://127.0.0.1/manifest",
+            "API_KEY": "bench",
+            "MNEMONIC_ENV_VAR": MNEMONIC,
+            "PAYCASTER_API_URL": f"{services_url}/paycaster",
+            "WARPCAST_API_URL": f"{services_url}/warpcast/v2/",
+            "FLEET_FILE": str(fleet_file),
+        }
+        for assignment in args.env:
+            key, _, value = assignment.partition("=")
+            server_env[key] = value
+        url = self.spawn("server", "main:app", port, server_env, app_dir=APP_DIR)
+        self.wait(url + "/v1")
+        return url, rovers
+
+    def wait(self, url: str, timeout: float = 60.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if any(process.poll() is not None for process in self.processes):
+                break
+            try:
+                if httpx.get(url, timeout=1.0).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"{url} did not come up, see the logs in {self.workdir}")
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Benchmark a running server instead, with its own rovers")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--rovers", type=int, default=2)
+    parser.add_argument("--fids", type=int, default=200, help="Distinct users picked from")
+    for service, latency in (("rover", 0.02), ("paycaster", 0.2), ("warpcast", 0.1)):
+        parser.add_argument(f"--{service}-latency", type=float, default=latency, help="Seconds")
+        parser.add_argument(f"--{service}-jitter", type=float, default=latency / 2, help="Seconds")
+        parser.add_argument(f"--{service}-failure-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--env", action="append", default=[], metavar="KEY=VALUE",
+        help="Extra environment of the frame server, e.g. IMAGE_WORKERS=4",
+    )
+    parser.add_argument("--save", type=Path, help="Write the results to this JSON file")
+    parser.add_argument("--compare", type=Path, help="Baseline JSON file to compare with")
+    args = parser.parse_args()
+
+    services = None
+    try:
+        if args.url:
+            url, rovers = args.url, ["A", "B"]
+        else:
+            services = Services(args)
+            url, rovers = services.start()
+        results = asyncio.run(run(url, rovers, args))
+    finally:
+        if services is not None:
+            services.stop()
+    if services is not None:
+        # Only kept, with the logs of the services, when something went wrong
+        shutil.rmtree(services.workdir)
+
+    baseline = json.loads(args.compare.read_text())["results"] if args.compare else None
+    report(results, baseline)
+    if args.save:
+        settings = {key: value for key, value in vars(args).items() if key not in ("save", "compare")}
+        args.save.write_text(json.dumps({"settings": settings, "results": results}, indent=2, default=str))
+        print(f"Saved to {args.save}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
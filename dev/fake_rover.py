@@ -1,39 +1,167 @@
+import asyncio
 from datetime import datetime
+from functools import lru_cache
 import io
+import math
+import os
+import time
+from typing import Dict, Optional
 
-from fastapi import FastAPI, Response
+from fastapi import Depends, FastAPI, Response
+from fastapi.responses import StreamingResponse
 from PIL import Image, ImageDraw, ImageFont
 import uvicorn
 
+from dev.faults import Faults
+
+# Frame width, the height follows at 16:9, and frames rendered per second
+WIDTH = int(os.getenv("FAKE_ROVER_WIDTH", "300"))
+FPS = float(os.getenv("FAKE_ROVER_FPS", "5"))
+QUALITY = int(os.getenv("FAKE_ROVER_QUALITY", "85"))
+# Seconds a rover keeps moving after a motor command, like a button press
+MOVE_TIME = float(os.getenv("FAKE_ROVER_MOVE_TIME", "0.5"))
+# Pixels per second when driving and degrees per second when turning
+SPEED = WIDTH / 4
+TURN_RATE = 180.0
+
+MULTIPART_BOUNDARY = "frame"
+
+
+@lru_cache(maxsize=None)
+def font(size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.load_default(size)
+
 
 def make_image(rover: str, ts: datetime, width: int = 300, colour: tuple = (255, 255, 255)) -> Image:
     img = Image.new("RGB", (width, int(width * 9 / 16)))
     lines = [f"Rover {rover}", ts.strftime("%Y-%m-%d %H:%M:%S")]
-    font = ImageFont.load_default(30)
+    text_font = font(width // 10)
     canvas = ImageDraw.Draw(img)
-    bbwidth = max([canvas.textlength(t, font) for t in lines])
-    bbheight = len(lines) * 45
+    bbwidth = max([canvas.textlength(t, text_font) for t in lines])
+    bbheight = len(lines) * int(width * 0.15)
     anchor = ((img.width - bbwidth) // 2, (img.height - bbheight) // 2)
     canvas.multiline_text(
-        anchor, "\n".join(lines), font=font, fill=colour, align="center"
+        anchor, "\n".join(lines), font=text_font, fill=colour, align="center"
     )
     return img
 
 
+class FakeRover:
+    """
+    A rover driving around its frame, and its latest encoded frame
+
+    Motor commands move or turn it for `MOVE_TIME` seconds. Frames are only
+    rendered when asked for, at most `FPS` times per second whatever the
+    number of clients, so that one process can stand in for many rovers.
+    """
+
+    def __init__(self, rover_id: str):
+        self.rover_id = rover_id
+        self.width = WIDTH
+        self.height = int(WIDTH * 9 / 16)
+        self.x = self.width / 2
+        self.y = self.height / 2
+        self.heading = -90.0
+        self.command = "stop"
+        self._moving_until = 0.0
+        self._updated_at = time.monotonic()
+        self._tick: Optional[int] = None
+        self._frame = b""
+
+    def drive(self, command: str):
+        self._move()
+        self.command = command
+        self._moving_until = time.monotonic() + MOVE_TIME if command != "stop" else 0.0
+
+    def _move(self):
+        now = time.monotonic()
+        elapsed = max(0.0, min(now, self._moving_until) - self._updated_at)
+        self._updated_at = now
+        if not elapsed:
+            return
+        if self.command in ("forward", "back"):
+            sign = 1 if self.command == "forward" else -1
+            radians = math.radians(self.heading)
+            self.x = (self.x + sign * SPEED * elapsed * math.cos(radians)) % self.width
+            self.y = (self.y + sign * SPEED * elapsed * math.sin(radians)) % self.height
+        elif self.command in ("left", "right"):
+            sign = 1 if self.command == "right" else -1
+            self.heading = (self.heading + sign * TURN_RATE * elapsed) % 360
+
+    def frame(self) -> bytes:
+        tick = int(time.time() * FPS)
+        if tick != self._tick:
+            self._move()
+            self._frame = self._render()
+            self._tick = tick
+        return self._frame
+
+    def _render(self) -> bytes:
+        moving = time.monotonic() < self._moving_until
+        img = make_image(self.rover_id, datetime.now(), self.width)
+        canvas = ImageDraw.Draw(img)
+        radians = math.radians(self.heading)
+        size = self.width / 20
+        nose = (self.x + size * math.cos(radians), self.y + size * math.sin(radians))
+        left = (
+            self.x + size * math.cos(radians + 2.5),
+            self.y + size * math.sin(radians + 2.5),
+        )
+        right = (
+            self.x + size * math.cos(radians - 2.5),
+            self.y + size * math.sin(radians - 2.5),
+        )
+        canvas.polygon([nose, left, right], fill=(255, 80, 0) if moving else (0, 200, 0))
+        canvas.text((4, 4), self.command, font=font(self.width // 20), fill=(200, 200, 200))
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=QUALITY)
+        img.close()
+        return buffer.getvalue()
+
+
+rovers: Dict[str, FakeRover] = {}
+
+
+def get_rover(rover: str) -> FakeRover:
+    if rover not in rovers:
+        rovers[rover] = FakeRover(rover)
+    return rovers[rover]
+
+
 app = FastAPI()
 
+# Slow or flaky rovers, see Faults.from_env
+faults = Faults.from_env("FAKE_ROVER")
+
 
-@app.get("/cameras/{rover}")
+@app.get("/cameras/{rover}", dependencies=[Depends(faults.apply)])
 async def cameras(rover: str):
-    buffer = io.BytesIO()
-    img = make_image(rover, datetime.now())
-    img.save(buffer, format="JPEG")
-    img.close()
-    return Response(buffer.getvalue(), media_type="image/jpeg")
+    return Response(get_rover(rover).frame(), media_type="image/jpeg")
+
+
+@app.get("/cameras/{rover}/stream")
+async def cameras_stream(rover: str):
+    """MJPEG stream like the one of the ESP-CAM, at `FPS` frames per second"""
+    fake = get_rover(rover)
+
+    async def frames():
+        while True:
+            jpeg = fake.frame()
+            yield (
+                f"--{MULTIPART_BOUNDARY}\r\n"
+                f"Content-Type: image/jpeg\r\n"
+                f"Content-Length: {len(jpeg)}\r\n\r\n"
+            ).encode() + jpeg + b"\r\n"
+            await asyncio.sleep(1 / FPS)
+
+    return StreamingResponse(
+        frames(), media_type=f"multipart/x-mixed-replace; boundary={MULTIPART_BOUNDARY}"
+    )
 
 
-@app.get("/tumbllers/{rover}/motor/{command}")
+@app.get("/tumbllers/{rover}/motor/{command}", dependencies=[Depends(faults.apply)])
 async def tumbllers_motor(rover: str, command: str):
+    get_rover(rover).drive(command)
     return {}
 
 
@@ -0,0 +1,64 @@
+import time
+
+from fastapi import Depends, FastAPI, Response
+import uvicorn
+
+from dev.faults import Faults
+
+# The frame page of PayCaster, we only read a couple of tags from its <head>
+PAYCASTER_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta property="og:image" content="https://example.com/paycaster/frame.png">
+<meta property="fc:frame" content="vNext">
+<meta property="fc:frame:button:1" content="Pay {amount} {token}">
+<meta property="fc:frame:button:1:action" content="tx">
+<meta property="fc:frame:button:1:target" content="https://example.com/paycaster/tx?amount={amount}&token={token}">
+</head>
+<body>{padding}</body>
+</html>
+"""
+
+app = FastAPI()
+
+# Slow or flaky third parties, see Faults.from_env
+paycaster_faults = Faults.from_env("FAKE_PAYCASTER")
+warpcast_faults = Faults.from_env("FAKE_WARPCAST")
+
+
+@app.get("/paycaster", dependencies=[Depends(paycaster_faults.apply)])
+async def paycaster(amount: str = "1", token: str = "USDC"):
+    page = PAYCASTER_PAGE.format(amount=amount, token=token, padding="x" * 64_000)
+    return Response(page, media_type="text/html")
+
+
+@app.put("/warpcast/v2/auth")
+async def warpcast_auth():
+    # Farcaster's client asks for a token when created and once it expired
+    expires_at = int(time.time() * 1000) + 24 * 3600 * 1000
+    return {"result": {"token": {"secret": "fake-token", "expiresAt": expires_at}}}
+
+
+@app.get("/warpcast/v2/user", dependencies=[Depends(warpcast_faults.apply)])
+async def warpcast_user(fid: int):
+    return {
+        "result": {
+            "user": {
+                "fid": fid,
+                "username": f"user{fid}",
+                "displayName": f"User {fid}",
+                "profile": {"bio": {"text": "", "mentions": []}},
+                "followerCount": 0,
+                "followingCount": 0,
+            }
+        }
+    }
+
+
+if __name__ == "__main__":
+    uvicorn.run(
+        "dev.fake_services:app",
+        host="0.0.0.0",
+        port=5002,
+        reload=True,
+    )
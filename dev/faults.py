@@ -0,0 +1,35 @@
+import asyncio
+import os
+import random
+
+from fastapi import HTTPException
+
+
+class Faults:
+    """
+    Latency, jitter and failures injected into the routes of a fake service
+
+    Use `apply` as a route dependency: every request waits `latency` plus up
+    to `jitter` seconds, then fails with a 503 with probability `failure_rate`.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+
+    @classmethod
+    def from_env(cls, prefix: str) -> "Faults":
+        """e.g. FAKE_ROVER_LATENCY, FAKE_ROVER_JITTER and FAKE_ROVER_FAILURE_RATE"""
+        return cls(
+            latency=float(os.getenv(f"{prefix}_LATENCY", "0")),
+            jitter=float(os.getenv(f"{prefix}_JITTER", "0")),
+            failure_rate=float(os.getenv(f"{prefix}_FAILURE_RATE", "0")),
+        )
+
+    async def apply(self):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if random.random() < self.failure_rate:
+            raise HTTPException(status_code=503, detail="Injected failure")
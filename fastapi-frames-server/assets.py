@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+logger = logging.getLogger(__name__)
+
+# URLs carrying the version of their content never change, see `version`
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Other ones are revalidated with their ETag after an hour
+REVALIDATE = "public, max-age=3600"
+
+# Images also served as WebP, losslessly for the PNG ones
+WEBP_SOURCES = {".png": True, ".jpg": False, ".jpeg": False}
+WEBP_QUALITY = 85
+
+
+def etag_of(data: bytes) -> str:
+    return f'"{hashlib.blake2b(data, digest_size=12).hexdigest()}"'
+
+
+def is_fresh(etag: str, scope: Scope) -> bool:
+    return etag in Headers(scope=scope).get("if-none-match", "")
+
+
+def to_webp(full_path: str, lossless: bool) -> Optional[bytes]:
+    """WebP copy of an image, None when it would not be any smaller"""
+    with open(full_path, "rb") as f:
+        data = f.read()
+    buffer = io.BytesIO()
+    Image.open(io.BytesIO(data)).save(buffer, "WEBP", lossless=lossless, quality=WEBP_QUALITY)
+    webp = buffer.getvalue()
+    logger.debug(f"Encoded {full_path} as WebP, {len(data)} to {len(webp)} bytes")
+    return webp if len(webp) < len(data) else None
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    Static files with caching headers, and images as WebP when accepted
+
+    `version(path)` is a digest of a file: URLs carrying it in their `v`
+    query parameter are cached for good, the others revalidated. Digests are
+    computed by `load_versions` at startup, off the event loop, and again
+    when a file is served with a new modification time. The WebP copy of an
+    image is encoded on its first request, off the event loop, and kept in
+    memory until the file changes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Path -> (modification time of the file, digest of its content)
+        self._versions: Dict[str, Tuple[float, str]] = {}
+        # Path -> (modification time of the file, WebP bytes, their ETag)
+        self._webp: Dict[str, Tuple[float, Optional[bytes], str]] = {}
+
+    def version(self, path: str) -> str:
+        cached = self._versions.get(path)
+        if cached is None:
+            # Only files added after `load_versions` are read on the event loop
+            cached = self._versions[path] = self._digest(path)
+        return cached[1]
+
+    async def load_versions(self):
+        """Digest every file up front, so `version` never reads one"""
+        paths = await asyncio.to_thread(self._paths)
+        for path in paths:
+            self._versions[path] = await asyncio.to_thread(self._digest, path)
+        logger.debug(f"Versioned {len(paths)} static files")
+
+    def _paths(self) -> List[str]:
+        paths = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                relative = os.path.relpath(os.path.join(root, name), self.directory)
+                paths.append(relative.replace(os.sep, "/"))
+        return paths
+
+    def _digest(self, path: str) -> Tuple[float, str]:
+        full_path, stat_result = self.lookup_path(path)
+        if stat_result is None:
+            raise FileNotFoundError(path)
+        with open(full_path, "rb") as f:
+            digest = hashlib.blake2b(f.read(), digest_size=6).hexdigest()
+        return stat_result.st_mtime, digest
+
+    async def _refresh_version(self, path: str, stat_result: os.stat_result):
+        cached = self._versions.get(path)
+        if cached is not None and cached[0] != stat_result.st_mtime:
+            self._versions[path] = await asyncio.to_thread(self._digest, path)
+            logger.info(f"Static file {path} changed, new version {self._versions[path][1]}")
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        versioned = "v" in QueryParams(scope.get("query_string", b""))
+        cache_control = IMMUTABLE if versioned else REVALIDATE
+        suffix = os.path.splitext(path)[1].lower()
+        webp = suffix in WEBP_SOURCES
+        if webp and "image/webp" in Headers(scope=scope).get("accept", ""):
+            response = await self._webp_response(path, suffix, scope)
+        else:
+            response = await super().get_response(path, scope)
+        stat_result = getattr(response, "stat_result", None)
+        if stat_result is not None:
+            await self._refresh_version(path, stat_result)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = cache_control
+            if webp:
+                response.headers["Vary"] = "Accept"
+        return response
+
+    async def _webp_response(self, path: str, suffix: str, scope: Scope) -> Response:
+        full_path, stat_result = await asyncio.to_thread(self.lookup_path, path)
+        if stat_result is None:
+            return await super().get_response(path, scope)
+        cached = self._webp.get(path)
+        await self._refresh_version(path, stat_result)
+        if cached is None or cached[0] != stat_result.st_mtime:
+            webp = await asyncio.to_thread(to_webp, full_path, WEBP_SOURCES[suffix])
+            cached = (stat_result.st_mtime, webp, etag_of(webp) if webp else "")
+            self._webp[path] = cached
+        _, webp, etag = cached
+        if webp is None:
+            return await super().get_response(path, scope)
+        if is_fresh(etag, scope):
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(webp, media_type="image/webp", headers={"ETag": etag})
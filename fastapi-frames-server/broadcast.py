@@ -0,0 +1,56 @@
+import asyncio
+from typing import Any, Optional, Set
+
+
+class Subscription:
+    """Bounded queue of a single subscriber, filled by a `Broadcast`"""
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, item: Any):
+        """Enqueue without blocking, dropping the oldest item when full"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+
+    async def get(self) -> Any:
+        return await self.queue.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Any:
+        return await self.queue.get()
+
+
+class Broadcast:
+    """
+    Fan-out of items to any number of subscribers
+
+    Publishing never waits: a slow subscriber loses its oldest items instead
+    of stalling the publisher or the other subscribers.
+    """
+
+    def __init__(self, maxsize: int = 2):
+        self.maxsize = maxsize
+        self._subscribers: Set[Subscription] = set()
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, subscription: Optional[Subscription] = None) -> Subscription:
+        """Add a subscriber, a new one unless an existing one is shared"""
+        if subscription is None:
+            subscription = Subscription(self.maxsize)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def publish(self, item: Any):
+        for subscription in self._subscribers:
+            subscription.offer(item)
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+class CameraPoller:
+    """
+    Background capture loop, one asyncio task per rover
+
+    While a session is active the camera is polled every `active_interval`
+    seconds. Once the rover is idle the interval doubles after each capture up
+    to `idle_interval`, and repeated capture failures back off up to
+    `max_backoff`. Request handlers only read the latest buffered frame, and
+    can ask for a fresh one without waiting through `wake`.
+    """
+
+    def __init__(
+        self,
+        capture: Callable[[str], Awaitable[bool]],
+        is_active: Callable[[str], bool],
+        active_interval: float = 1.0,
+        idle_interval: float = 30.0,
+        max_backoff: float = 60.0,
+    ):
+        self._capture = capture
+        self._is_active = is_active
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+        self.max_backoff = max_backoff
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._wakeups: Dict[str, asyncio.Event] = {}
+
+    def start(self, rover_ids: Iterable[str]):
+        for rover_id in rover_ids:
+            if rover_id in self._tasks:
+                continue
+            self._wakeups[rover_id] = asyncio.Event()
+            self._tasks[rover_id] = asyncio.create_task(
+                self._run(rover_id), name=f"camera-poller-{rover_id}"
+            )
+        logger.info(f"Camera pollers started for rovers: {', '.join(self._tasks)}")
+
+    async def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+        self._wakeups.clear()
+
+    def wake(self, rover_id: str):
+        """Capture a new frame as soon as possible, without waiting for it"""
+        event = self._wakeups.get(rover_id)
+        if event is not None:
+            event.set()
+
+    async def _run(self, rover_id: str):
+        interval = self.active_interval
+        failures = 0
+        while True:
+            wakeup = self._wakeups[rover_id]
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+
+            try:
+                success = await self._capture(rover_id)
+            except Exception as e:
+                logger.error(f"Camera poller for Rover {rover_id} failed: {e}")
+                success = False
+            failures = 0 if success else failures + 1
+
+            if self._is_active(rover_id):
+                interval = self.active_interval
+            else:
+                interval = min(self.idle_interval, interval * 2)
+            if failures:
+                interval = min(self.max_backoff, interval * 2**failures)
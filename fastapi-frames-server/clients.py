@@ -0,0 +1,100 @@
+import logging
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Rovers sit on the local network: connecting should be near instant, so a
+# short connect timeout surfaces an offline ESP32 quickly, while the read
+# timeouts match the previous per-call values.
+CAMERA_TIMEOUT = httpx.Timeout(5.0, connect=2.0)
+MOTOR_TIMEOUT = httpx.Timeout(10.0, connect=2.0)
+PAYCASTER_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+# A live stream that stays silent this long is reconnected
+STREAM_TIMEOUT = httpx.Timeout(10.0, connect=2.0)
+
+# The ESP32s only handle a couple of sockets at once, keep the pools small:
+# httpx limits are per client, so they are sized by the number of rovers
+ROVER_CONNECTIONS = 2
+ROVER_KEEPALIVE_CONNECTIONS = 1
+
+
+def rover_limits(rovers: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=ROVER_CONNECTIONS * rovers,
+        max_keepalive_connections=ROVER_KEEPALIVE_CONNECTIONS * rovers,
+        keepalive_expiry=30.0,
+    )
+
+PAYCASTER_LIMITS = httpx.Limits(
+    max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0
+)
+# At most one long-lived stream per rover, bounded by the relay itself
+STREAM_LIMITS = httpx.Limits(max_connections=None, max_keepalive_connections=0)
+
+
+class UpstreamClients:
+    """Long-lived HTTP clients, one per upstream, shared by all requests"""
+
+    def __init__(self):
+        self._camera: Optional[httpx.AsyncClient] = None
+        self._motor: Optional[httpx.AsyncClient] = None
+        self._paycaster: Optional[httpx.AsyncClient] = None
+        self._stream: Optional[httpx.AsyncClient] = None
+
+    def start(self, rovers: int = 2):
+        """Create the clients, called once from the app lifespan"""
+        limits = rover_limits(rovers)
+        # Loading the CA bundle takes tens of milliseconds, do it once for all
+        ssl_context = httpx.create_ssl_context()
+        self._camera = httpx.AsyncClient(
+            timeout=CAMERA_TIMEOUT, limits=limits, verify=ssl_context
+        )
+        self._motor = httpx.AsyncClient(
+            timeout=MOTOR_TIMEOUT, limits=limits, verify=ssl_context
+        )
+        self._paycaster = httpx.AsyncClient(
+            timeout=PAYCASTER_TIMEOUT,
+            limits=PAYCASTER_LIMITS,
+            http2=True,
+            follow_redirects=True,
+            verify=ssl_context,
+        )
+        self._stream = httpx.AsyncClient(
+            timeout=STREAM_TIMEOUT, limits=STREAM_LIMITS, verify=ssl_context
+        )
+        logger.info("Upstream HTTP clients started")
+
+    async def aclose(self):
+        """Close the clients and their pooled connections at shutdown"""
+        for client in (self._camera, self._motor, self._paycaster, self._stream):
+            if client is not None:
+                await client.aclose()
+        self._camera = self._motor = self._paycaster = self._stream = None
+        logger.info("Upstream HTTP clients closed")
+
+    @property
+    def camera(self) -> httpx.AsyncClient:
+        return self._get(self._camera, "camera")
+
+    @property
+    def motor(self) -> httpx.AsyncClient:
+        return self._get(self._motor, "motor")
+
+    @property
+    def paycaster(self) -> httpx.AsyncClient:
+        return self._get(self._paycaster, "paycaster")
+
+    @property
+    def stream(self) -> httpx.AsyncClient:
+        return self._get(self._stream, "stream")
+
+    @staticmethod
+    def _get(client: Optional[httpx.AsyncClient], name: str) -> httpx.AsyncClient:
+        if client is None:
+            raise RuntimeError(f"The {name} HTTP client is not started")
+        return client
+
+
+upstream = UpstreamClients()
@@ -0,0 +1,24 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+def coalesce(
+    inflight: Dict[Hashable, asyncio.Future],
+    key: Hashable,
+    factory: Callable[[], Awaitable[T]],
+) -> Awaitable[T]:
+    """
+    Await the run of `key` in `inflight`, started with `factory` if none is
+
+    Concurrent callers with the same key share a single run, dropped from
+    `inflight` once done. A cancelled caller does not cancel the run the
+    other callers wait on.
+    """
+    future = inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(factory())
+        inflight[key] = future
+        future.add_done_callback(lambda _: inflight.pop(key, None))
+    return asyncio.shield(future)
@@ -11,12 +11,22 @@ load_dotenv(dotenv_path=env_path)
 # Get environment
 ENV = os.getenv("ENVIRONMENT", "development")  # Default to development if not set
 
+
+def default_stream_url(camera_url: str) -> str:
+    """The ESP-CAM serves its MJPEG stream next to the still image endpoint"""
+    return camera_url.removesuffix("/getImage") + "/stream"
+
+
 # Production configuration (for GitHub)
 PROD_CONFIG = {
     "TUMBLLER_CAMERA_URLS": {
         "A": "http://rover-a-cam.local/getImage",
         "B": "http://rover-b-cam.local/getImage",
     },
+    "TUMBLLER_STREAM_URLS": {
+        "A": "http://rover-a-cam.local/stream",
+        "B": "http://rover-b-cam.local/stream",
+    },
     "BASE_URL": "https://ngrok-ip.ngrok-free.app",
     "TUMBLLER_BASE_URLS": {
         "A": "http://tumbller-a.local",
@@ -30,6 +40,20 @@ DEV_CONFIG = {
         "A": os.getenv("CAMERA_URL_A", PROD_CONFIG["TUMBLLER_CAMERA_URLS"]["A"]),
         "B": os.getenv("CAMERA_URL_B", PROD_CONFIG["TUMBLLER_CAMERA_URLS"]["B"]),
     },
+    "TUMBLLER_STREAM_URLS": {
+        "A": os.getenv(
+            "STREAM_URL_A",
+            default_stream_url(
+                os.getenv("CAMERA_URL_A", PROD_CONFIG["TUMBLLER_CAMERA_URLS"]["A"])
+            ),
+        ),
+        "B": os.getenv(
+            "STREAM_URL_B",
+            default_stream_url(
+                os.getenv("CAMERA_URL_B", PROD_CONFIG["TUMBLLER_CAMERA_URLS"]["B"])
+            ),
+        ),
+    },
     "BASE_URL": os.getenv("BASE_URL", PROD_CONFIG["BASE_URL"]),
     "TUMBLLER_BASE_URLS": {
         "A": os.getenv("TUMBLLER_URL_A", PROD_CONFIG["TUMBLLER_BASE_URLS"]["A"]),
@@ -48,6 +72,106 @@ TUMBLLER_CAMERA_URLS = current_config["TUMBLLER_CAMERA_URLS"]
 FQDN = os.environ["FQDN"]
 BASE_URL = current_config["BASE_URL"]
 TUMBLLER_BASE_URLS = current_config["TUMBLLER_BASE_URLS"]
+TUMBLLER_STREAM_URLS = current_config["TUMBLLER_STREAM_URLS"]
 
 FARCASTER_HOSTED_MANIFEST_URL = os.environ["FARCASTER_HOSTED_MANIFEST_URL"]
 
+
+def load_fleet_config() -> list:
+    """
+    The rovers to serve, as a list of dicts
+
+    Read from the JSON file at FLEET_FILE when set, e.g.
+    [{"id": "C", "camera_url": "http://rover-c-cam.local/getImage",
+      "motor_url": "http://tumbller-c.local", "session_duration": 300}]
+    where "stream_url" and "session_duration" are optional. Otherwise the
+    rovers A and B of the configuration above.
+    """
+    fleet_file = os.getenv("FLEET_FILE")
+    if fleet_file:
+        with open(fleet_file) as f:
+            return json.load(f)
+    return [
+        {
+            "id": rover_id,
+            "camera_url": TUMBLLER_CAMERA_URLS[rover_id],
+            "motor_url": TUMBLLER_BASE_URLS[rover_id],
+            "stream_url": TUMBLLER_STREAM_URLS[rover_id],
+        }
+        for rover_id in TUMBLLER_CAMERA_URLS
+    ]
+
+
+FLEET_CONFIG = load_fleet_config()
+# Rovers contacted at once when taking the first pictures at startup
+STARTUP_CONCURRENCY = int(os.getenv("STARTUP_CONCURRENCY", "8"))
+# Seconds until requests are served above which the startup report warns
+STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", "2.0"))
+
+
+# Number of encoded frames kept in memory per rover
+FRAME_BUFFER_DEPTH = int(os.getenv("FRAME_BUFFER_DEPTH", "5"))
+# Also write every frame to static/, only useful for debugging
+PERSIST_FRAMES = os.getenv("PERSIST_FRAMES", "False").lower() in ("true", "1", "t")
+
+# Camera polling, in seconds, while a session is active and at most when idle
+CAMERA_POLL_INTERVAL = float(os.getenv("CAMERA_POLL_INTERVAL", "1.0"))
+CAMERA_IDLE_INTERVAL = float(os.getenv("CAMERA_IDLE_INTERVAL", "30.0"))
+
+# Frames buffered per viewer of a live stream before older ones are dropped
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "2"))
+
+# Frame encoding: full size for the viewer, a small thumbnail for frame embeds
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "95"))
+THUMBNAIL_WIDTH = int(os.getenv("THUMBNAIL_WIDTH", "320"))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "70"))
+# Progressive and optimized JPEG frames: smaller, and shown before they are
+# fully downloaded, for a slightly slower encode
+PROGRESSIVE_JPEG = os.getenv("PROGRESSIVE_JPEG", "True").lower() in ("true", "1", "t")
+# Frames encoded on request at the width a client displays them, as WebP when
+# it accepts it, within a byte budget if not 0
+VARIANT_QUALITY = int(os.getenv("VARIANT_QUALITY", "80"))
+VARIANT_MAX_BYTES = int(os.getenv("VARIANT_MAX_BYTES", "60000"))
+WEBP_FRAMES = os.getenv("WEBP_FRAMES", "True").lower() in ("true", "1", "t")
+# Quality of frames re-encoded only to refresh the countdown overlay
+RETIME_QUALITY = int(os.getenv("RETIME_QUALITY", "80"))
+# Threads decoding, annotating and encoding camera frames
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+# Where rover sessions live: "memory" for a single worker, "sqlite" to share
+# them between several uvicorn workers
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+
+# FID to username resolution through Warpcast
+USERNAME_CACHE_SIZE = int(os.getenv("USERNAME_CACHE_SIZE", "1024"))
+USERNAME_CACHE_TTL = float(os.getenv("USERNAME_CACHE_TTL", "3600"))
+USERNAME_LOOKUP_TIMEOUT = float(os.getenv("USERNAME_LOOKUP_TIMEOUT", "2.0"))
+# Threads of the lookups, stalled ones never take up the default executor
+USERNAME_LOOKUP_WORKERS = int(os.getenv("USERNAME_LOOKUP_WORKERS", "4"))
+# Only changed to run against a fake Warpcast, like the one of dev/bench.py
+WARPCAST_API_URL = os.getenv("WARPCAST_API_URL", "https://api.warpcast.com/v2/")
+# Seconds a request to Warpcast may take, the SDK would wait forever
+WARPCAST_TIMEOUT = float(os.getenv("WARPCAST_TIMEOUT", "5.0"))
+
+PAYCASTER_API_URL = os.getenv("PAYCASTER_API_URL", "https://app.paycaster.co/api/customs/")
+# Seconds a sender independent PayCaster frame is reused
+PAYCASTER_CACHE_TTL = float(os.getenv("PAYCASTER_CACHE_TTL", "300"))
+
+# Motor commands: queued per rover, dropped when still waiting after the
+# deadline, and abandoned when the rover takes longer than the timeout
+COMMAND_QUEUE_SIZE = int(os.getenv("COMMAND_QUEUE_SIZE", "4"))
+COMMAND_DEADLINE = float(os.getenv("COMMAND_DEADLINE", "1.0"))
+COMMAND_TIMEOUT = float(os.getenv("COMMAND_TIMEOUT", "5.0"))
+
+# Rover health: probed every interval, a camera or motor board is considered
+# down after the given failures in a row and retried after the reset timeout.
+# Keep the probe timeout below the camera and motor client timeouts
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "10.0"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "1.0"))
+HEALTH_FAILURE_THRESHOLD = int(os.getenv("HEALTH_FAILURE_THRESHOLD", "3"))
+HEALTH_RESET_TIMEOUT = float(os.getenv("HEALTH_RESET_TIMEOUT", "15.0"))
+
+# Waiting queues of busy rovers: seconds the next in line has to take a rover
+# once it is free, and after which a waiter whose page closed loses their place
+RESERVATION_CLAIM_WINDOW = float(os.getenv("RESERVATION_CLAIM_WINDOW", "45.0"))
+RESERVATION_GRACE = float(os.getenv("RESERVATION_GRACE", "30.0"))
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import (
+    create_engine,
+    event,
+    select,
+    tuple_,
+    Column,
+    Float,
+    Index,
+    Integer,
+    Select,
+    String,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.ext.declarative import declarative_base
+
+from metrics import DB_COMMIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Database setup
+SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./sql_app.db"
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+Base = declarative_base()
+
+# Request handlers use the async engine, its pooled connections live in
+# aiosqlite threads so commits never block the event loop
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL, pool_size=5, max_overflow=5
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
+
+@event.listens_for(engine, "connect")
+@event.listens_for(async_engine.sync_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL lets readers and the writer of several workers proceed concurrently,
+    and with synchronous=NORMAL commits no longer wait for an fsync
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+class Transaction(Base):
+    __tablename__ = "transactions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    transaction_id = Column(String, unique=True, index=True)
+    user = Column(String, index=True)
+    rover_id = Column(String, index=True)
+    timestamp = Column(Float, index=True)
+
+    # Keyset pagination walks (timestamp, id) from the newest row
+    __table_args__ = (Index("ix_transactions_timestamp_id", "timestamp", "id"),)
+
+
+class RoverSession(Base):
+    """Current session of each rover, shared by all workers"""
+
+    __tablename__ = "rover_sessions"
+
+    rover_id = Column(String, primary_key=True)
+    transaction_id = Column(String, nullable=True)
+    user = Column(String, nullable=True)
+    start_time = Column(Float, nullable=False, default=0)
+    duration = Column(Integer, nullable=False, default=0)
+
+
+Base.metadata.create_all(bind=engine)
+# create_all leaves existing tables alone, add indexes introduced since
+for index in Transaction.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
+
+
+def transactions_query(
+    rover_id: Optional[str] = None,
+    user: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    before: Optional[Tuple[float, int]] = None,
+) -> Select:
+    """
+    Transactions newest first, optionally filtered
+
+    `before` is the (timestamp, id) of the last row of the previous page.
+    """
+    query = select(Transaction).order_by(
+        Transaction.timestamp.desc(), Transaction.id.desc()
+    )
+    if rover_id:
+        query = query.where(Transaction.rover_id == rover_id)
+    if user:
+        query = query.where(Transaction.user == user)
+    if since is not None:
+        query = query.where(Transaction.timestamp >= since)
+    if until is not None:
+        query = query.where(Transaction.timestamp < until)
+    if before is not None:
+        query = query.where(tuple_(Transaction.timestamp, Transaction.id) < before)
+    return query
+
+
+# Database dependency
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+class TransactionWriter:
+    """
+    Group commit of `Transaction` inserts
+
+    Callbacks arriving together are written in a single commit: the writer
+    takes every insert queued within `max_delay` seconds, up to `max_batch`.
+    A transaction id already recorded is not inserted again, `add` tells the
+    caller instead. Should the batch violate another constraint, its rows are
+    retried one by one so only the offending insert fails.
+    """
+
+    def __init__(self, max_batch: int = 50, max_delay: float = 0.005):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="transaction-writer")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def add(self, **values: Any) -> bool:
+        """Insert a transaction once committed, False if it was already recorded"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((values, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            with DB_COMMIT_SECONDS.time():
+                await self._commit(batch)
+
+    async def _commit(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        try:
+            async with AsyncSessionLocal() as db:
+                created = []
+                for values, _ in batch:
+                    result = await db.execute(
+                        sqlite_insert(Transaction)
+                        .values(**values)
+                        .on_conflict_do_nothing(index_elements=["transaction_id"])
+                    )
+                    created.append(result.rowcount == 1)
+                await db.commit()
+        except IntegrityError as e:
+            if len(batch) > 1:
+                for item in batch:
+                    await self._commit([item])
+            else:
+                self._resolve(batch, error=e)
+            return
+        except Exception as e:
+            logger.error(f"Error committing {len(batch)} transactions: {e}")
+            self._resolve(batch, error=e)
+            return
+        logger.debug(f"Committed {sum(created)} of {len(batch)} transactions")
+        self._resolve(batch, created=created)
+
+    @staticmethod
+    def _resolve(
+        batch, created: Optional[List[bool]] = None, error: Optional[Exception] = None
+    ):
+        for index, (_, future) in enumerate(batch):
+            # The caller may have given up waiting
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(created[index])
+            else:
+                future.set_exception(error)
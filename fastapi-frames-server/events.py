@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from broadcast import Broadcast, Subscription
+from sessions import RoverControl
+
+logger = logging.getLogger(__name__)
+
+
+class Event:
+    __slots__ = ("type", "data")
+
+    def __init__(self, type: str, data: Dict):
+        self.type = type
+        self.data = data
+
+    def encode(self) -> str:
+        """Server-Sent Events wire format"""
+        return f"event: {self.type}\ndata: {json.dumps(self.data)}\n\n"
+
+
+class EventHub:
+    """
+    Per-rover broadcast of events to Server-Sent Events clients
+
+    A subscriber may follow several rovers through a single bounded queue,
+    the oldest events are dropped when it falls behind.
+    """
+
+    def __init__(self, queue_size: int = 16):
+        self.queue_size = queue_size
+        self._broadcasts: Dict[str, Broadcast] = {}
+
+    def subscribers(self) -> int:
+        return sum(len(broadcast) for broadcast in self._broadcasts.values())
+
+    def subscribe(self, rover_ids: Iterable[str]) -> Subscription:
+        subscription = Subscription(self.queue_size)
+        for rover_id in rover_ids:
+            broadcast = self._broadcasts.setdefault(rover_id, Broadcast(self.queue_size))
+            broadcast.subscribe(subscription)
+        return subscription
+
+    def unsubscribe(self, rover_ids: Iterable[str], subscription: Subscription):
+        for rover_id in rover_ids:
+            broadcast = self._broadcasts.get(rover_id)
+            if broadcast is not None:
+                broadcast.unsubscribe(subscription)
+
+    def publish(self, rover_id: str, type: str, **data):
+        broadcast = self._broadcasts.get(rover_id)
+        if broadcast:
+            broadcast.publish(Event(type, {"rover_id": rover_id, **data}))
+
+
+class SessionWatcher:
+    """
+    Publishes availability and session changes of the rovers
+
+    Sessions expire with time and may be started by another worker, so the
+    sessions are read every `interval` seconds, and right away when `poke`
+    is called after a local change. This also keeps the snapshot of every
+    `RoverControl` fresh for the readers outside of requests, like the
+    camera poller. Every tick, `on_check` is called with the id and
+    availability of every rover, and the changes are published. What else
+    decides whether a rover can be selected comes from `describe`, and is
+    sent along with its availability.
+    """
+
+    def __init__(
+        self,
+        hub: EventHub,
+        rover_controls: Dict[str, RoverControl],
+        interval: float = 1.0,
+        on_check: Optional[Callable[[str, bool], None]] = None,
+        describe: Optional[Callable[[str], Dict]] = None,
+    ):
+        self.hub = hub
+        self.rover_controls = rover_controls
+        self.interval = interval
+        self.on_check = on_check
+        self.describe = describe
+        self._last: Dict[str, Tuple[bool, Optional[str]]] = {}
+        self._details: Dict[str, Dict] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="session-watcher")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def poke(self, rover_id: Optional[str] = None):
+        self._wakeup.set()
+
+    async def load(self):
+        await asyncio.gather(*(rover.load() for rover in self.rover_controls.values()))
+
+    def check(self):
+        for rover_id, rover in self.rover_controls.items():
+            available = rover.is_available()
+            if self.on_check:
+                self.on_check(rover_id, available)
+            details = self.describe(rover_id) if self.describe else {}
+            state = (available, None if available else rover.transaction_id)
+            last = self._last.get(rover_id)
+            last_details = self._details.get(rover_id)
+            self._last[rover_id] = state
+            self._details[rover_id] = details
+            if last is None:
+                continue
+            if last[0] != available or last_details != details:
+                self.hub.publish(rover_id, "availability", available=available, **details)
+            if last == state:
+                continue
+            self.hub.publish(
+                rover_id,
+                "session",
+                active=not available,
+                time_left=rover.get_time_left(raw=True),
+            )
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.load()
+                self.check()
+            except Exception as e:
+                logger.error(f"Error checking rover sessions: {e}")
@@ -0,0 +1,83 @@
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+
+class Rover:
+    """Where to reach a rover, and how long its sessions last"""
+
+    __slots__ = ("id", "camera_url", "motor_url", "stream_url", "session_duration")
+
+    def __init__(
+        self,
+        id: str,
+        camera_url: str,
+        motor_url: str,
+        stream_url: str,
+        session_duration: int,
+    ):
+        self.id = id
+        self.camera_url = camera_url
+        self.motor_url = motor_url
+        self.stream_url = stream_url
+        self.session_duration = session_duration
+
+
+class Fleet:
+    """
+    The rovers served by this instance, by id and in display order
+
+    Iterating over the fleet yields the rover ids, like a dict.
+    """
+
+    def __init__(self, rovers: Iterable[Rover]):
+        self._rovers: Dict[str, Rover] = {}
+        for rover in rovers:
+            if rover.id in self._rovers:
+                raise ValueError(f"Rover {rover.id} is configured twice")
+            self._rovers[rover.id] = rover
+
+    @classmethod
+    def from_config(
+        cls,
+        entries: List[Dict],
+        session_duration: int,
+        stream_url: Optional[Callable[[str], str]] = None,
+    ) -> "Fleet":
+        """
+        Build the fleet from `FLEET_CONFIG` entries
+
+        Missing session durations default to `session_duration`, and missing
+        stream URLs are derived from the camera URL with `stream_url`.
+        """
+        return cls(
+            Rover(
+                id=str(entry["id"]),
+                camera_url=entry["camera_url"],
+                motor_url=entry["motor_url"],
+                stream_url=entry.get("stream_url")
+                or (stream_url(entry["camera_url"]) if stream_url else None),
+                session_duration=int(entry.get("session_duration", session_duration)),
+            )
+            for entry in entries
+        )
+
+    def __getitem__(self, rover_id: str) -> Rover:
+        return self._rovers[rover_id]
+
+    def __contains__(self, rover_id: str) -> bool:
+        return rover_id in self._rovers
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rovers)
+
+    def __len__(self) -> int:
+        return len(self._rovers)
+
+    def get(self, rover_id: str) -> Optional[Rover]:
+        return self._rovers.get(rover_id)
+
+    def rovers(self) -> Iterable[Rover]:
+        return self._rovers.values()
+
+    def urls(self, kind: str) -> Dict[str, str]:
+        """URLs of one kind by rover id, e.g. `fleet.urls("camera_url")`"""
+        return {rover.id: getattr(rover, kind) for rover in self._rovers.values()}
@@ -0,0 +1,75 @@
+from collections import deque
+import secrets
+import time
+from typing import Deque, Dict, Optional
+
+# Variant served when a request does not ask for a specific size
+FULL = "full"
+
+# Tells this process apart in frame URLs: sequence numbers start over with
+# the process, and every worker has buffers of its own
+BOOT_ID = secrets.token_hex(6)
+
+
+class Frame:
+    """
+    A camera frame and its sequence number within the rover buffer
+
+    `variants` maps an encoding profile name, e.g. "full" or "thumb", to the
+    encoded bytes of the frame.
+    """
+
+    __slots__ = ("seq", "variants", "timestamp")
+
+    def __init__(self, seq: int, variants: Dict[str, bytes], timestamp: float):
+        self.seq = seq
+        self.variants = variants
+        self.timestamp = timestamp
+
+    @property
+    def data(self) -> bytes:
+        return self.variants[FULL]
+
+
+class FrameBuffer:
+    """
+    Ring buffer holding the most recent encoded frames of a rover
+
+    Sequence numbers increase monotonically for the lifetime of the process,
+    so a `seq` once handed out always refers to the same bytes, or to nothing
+    once the frame has been evicted. Only along with `BOOT_ID` does it
+    identify a frame across restarts and workers.
+    """
+
+    def __init__(self, depth: int = 5):
+        if depth < 1:
+            raise ValueError("Frame buffer depth must be at least 1")
+        self._frames: Deque[Frame] = deque(maxlen=depth)
+        self._next_seq = 1
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    @property
+    def depth(self) -> int:
+        return self._frames.maxlen
+
+    def push(self, variants: Dict[str, bytes]) -> Frame:
+        """Store a new frame, evicting the oldest one when full"""
+        frame = Frame(self._next_seq, variants, time.time())
+        self._next_seq += 1
+        self._frames.append(frame)
+        return frame
+
+    def latest(self) -> Optional[Frame]:
+        return self._frames[-1] if self._frames else None
+
+    def get(self, seq: int) -> Optional[Frame]:
+        """Frame with the given sequence number, if still buffered"""
+        if not self._frames:
+            return None
+        # Sequence numbers are contiguous inside the buffer
+        index = seq - self._frames[0].seq
+        if 0 <= index < len(self._frames):
+            return self._frames[index]
+        return None
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Tracks whether an upstream answers, to fail fast while it does not
+
+    After `failure_threshold` failures in a row the circuit opens and calls
+    are refused. Once `reset_timeout` seconds passed it is half open: calls go
+    through again, the first success closing it and a failure reopening it.
+    The latency of successful calls is averaged with an EWMA.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 3,
+        reset_timeout: float = 15.0,
+        alpha: float = 0.3,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.alpha = alpha
+        self.failures = 0
+        self.latency: Optional[float] = None
+        self._opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def allow(self) -> bool:
+        return self.state != OPEN
+
+    def record_success(self, latency: float):
+        if self._opened_at is not None:
+            logger.info(f"{self.name} is back, closing its circuit")
+        self.failures = 0
+        self._opened_at = None
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = self.alpha * latency + (1 - self.alpha) * self.latency
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or (
+            self._opened_at is None and self.failures >= self.failure_threshold
+        ):
+            if self._opened_at is None:
+                logger.warning(f"{self.name} is not responding, opening its circuit")
+            self._opened_at = time.monotonic()
+
+
+class RoverHealth:
+    __slots__ = ("camera", "motor")
+
+    def __init__(self, rover_id: str, **breaker_options):
+        self.camera = CircuitBreaker(f"Camera of Rover {rover_id}", **breaker_options)
+        self.motor = CircuitBreaker(f"Tumbller {rover_id}", **breaker_options)
+
+    @property
+    def healthy(self) -> bool:
+        """Whether the rover can be driven, a camera down only loses the picture"""
+        return self.motor.allow()
+
+    def as_dict(self) -> Dict:
+        return {
+            name: {
+                "state": breaker.state,
+                "failures": breaker.failures,
+                "latency": breaker.latency,
+            }
+            for name, breaker in (("camera", self.camera), ("motor", self.motor))
+        }
+
+
+class HealthMonitor:
+    """
+    Probes the camera and motor board of every rover in the background
+
+    A probe is a plain GET on the configured URL of the device, through the
+    client its real requests use, any HTTP answer meaning it is up. Probes
+    give up after `timeout` seconds, shorter than the timeouts of the clients,
+    so a hung device is noticed before requests queue up behind it. The
+    outcome of real captures and commands is recorded in the same circuit
+    breakers, so callers can skip a rover that is down instead of waiting for
+    their full timeout.
+    """
+
+    def __init__(
+        self,
+        get_camera_client: Callable[[], httpx.AsyncClient],
+        get_motor_client: Callable[[], httpx.AsyncClient],
+        camera_urls: Dict[str, str],
+        motor_urls: Dict[str, str],
+        interval: float = 10.0,
+        timeout: float = 1.0,
+        **breaker_options,
+    ):
+        self._get_camera_client = get_camera_client
+        self._get_motor_client = get_motor_client
+        self.camera_urls = camera_urls
+        self.motor_urls = motor_urls
+        self.interval = interval
+        self.timeout = timeout
+        self.rovers: Dict[str, RoverHealth] = {
+            rover_id: RoverHealth(rover_id, **breaker_options)
+            for rover_id in camera_urls
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    def __getitem__(self, rover_id: str) -> RoverHealth:
+        return self.rovers[rover_id]
+
+    def is_healthy(self, rover_id: str) -> bool:
+        return self.rovers[rover_id].healthy
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="health-monitor")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def check(self, rover_ids: Optional[Iterable[str]] = None):
+        probes = []
+        for rover_id in rover_ids or self.rovers:
+            health = self.rovers[rover_id]
+            probes.append(
+                self._probe(
+                    self._get_camera_client(), health.camera, self.camera_urls[rover_id]
+                )
+            )
+            probes.append(
+                self._probe(
+                    self._get_motor_client(), health.motor, self.motor_urls[rover_id]
+                )
+            )
+        await asyncio.gather(*probes)
+
+    async def _probe(self, client: httpx.AsyncClient, breaker: CircuitBreaker, url: str):
+        start = time.monotonic()
+        try:
+            await client.get(url, timeout=self.timeout)
+        except httpx.HTTPError as e:
+            logger.debug(f"Health probe of {breaker.name} failed: {e!r}")
+            breaker.record_failure()
+        else:
+            breaker.record_success(time.monotonic() - start)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Error checking rover health: {e}")
+            await asyncio.sleep(self.interval)
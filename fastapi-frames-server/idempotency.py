@@ -0,0 +1,58 @@
+import asyncio
+from collections import OrderedDict
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from coalesce import coalesce
+
+
+class IdempotentResults:
+    """
+    Runs an operation once per key and replays its result
+
+    Concurrent calls with the same key share a single run, and later calls
+    get the result cached for `ttl` seconds, for at most `max_size` keys.
+    Failures are not cached, so that a retry runs the operation again, and
+    neither are the results `keep` turns down.
+    """
+
+    def __init__(self, max_size: int = 4096, ttl: float = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._results: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.replayed = 0
+
+    async def run(
+        self,
+        key: str,
+        operation: Callable[[], Awaitable[Any]],
+        keep: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        cached = self._results.get(key)
+        if cached is not None:
+            result, expires = cached
+            if expires > time.monotonic():
+                self.replayed += 1
+                return result
+            del self._results[key]
+
+        if key in self._inflight:
+            self.replayed += 1
+        return await coalesce(
+            self._inflight, key, lambda: self._run(key, operation, keep)
+        )
+
+    async def _run(
+        self,
+        key: str,
+        operation: Callable[[], Awaitable[Any]],
+        keep: Optional[Callable[[Any], bool]],
+    ) -> Any:
+        result = await operation()
+        if keep is not None and not keep(result):
+            return result
+        self._results[key] = (result, time.monotonic() + self.ttl)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+        return result
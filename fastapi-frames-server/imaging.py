@@ -0,0 +1,297 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import io
+import logging
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from coalesce import coalesce
+
+logger = logging.getLogger(__name__)
+
+# Common Linux font paths
+FONT_PATHS = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf",
+]
+FONT_SIZE = 60
+
+
+@lru_cache(maxsize=None)
+def load_font(size: int = FONT_SIZE) -> ImageFont.ImageFont:
+    """Load the overlay font once per process, falling back to Pillow's default"""
+    for font_path in FONT_PATHS:
+        try:
+            font = ImageFont.truetype(font_path, size=size)
+            logger.info(f"Successfully loaded font from: {font_path}")
+            return font
+        except IOError:
+            continue
+    logger.warning("No TrueType font found, using default")
+    return ImageFont.load_default()
+
+
+JPEG = "jpeg"
+WEBP = "webp"
+MEDIA_TYPES = {JPEG: "image/jpeg", WEBP: "image/webp"}
+
+# Widths of the variants encoded on request, a requested width is rounded up
+# to one of them so that each frame only ever has a handful of variants
+VARIANT_WIDTHS = (160, 240, 320, 480, 640, 800, 1024, 1280)
+# Lowest quality tried when squeezing a frame into its byte budget
+MIN_QUALITY = 40
+
+
+def snap_width(width: int) -> int:
+    """The variant width serving a client displaying frames `width` pixels wide"""
+    return next((snapped for snapped in VARIANT_WIDTHS if snapped >= width), VARIANT_WIDTHS[-1])
+
+
+class EncodeProfile:
+    """
+    Encoding settings of one frame variant
+
+    With `max_bytes`, the quality is lowered as needed for the frame to fit,
+    down to `MIN_QUALITY`. `progressive` only applies to JPEG.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        quality: int,
+        max_width: Optional[int] = None,
+        format: str = JPEG,
+        progressive: bool = False,
+        max_bytes: Optional[int] = None,
+    ):
+        self.name = name
+        self.quality = quality
+        self.max_width = max_width
+        self.format = format
+        self.progressive = progressive
+        self.max_bytes = max_bytes
+
+
+class GlyphAtlas:
+    """
+    Pre-rendered glyphs of the countdown overlay
+
+    The "Time left: " prefix, the digits and the colon are drawn once in
+    yellow on black. A timer box is then a handful of pastes rather than a
+    text layout and rasterisation on every frame.
+    """
+
+    PREFIX = "Time left: "
+    CHARS = "0123456789:"
+    # Black margin around the text, as the box used to be drawn
+    MARGIN = 10
+
+    def __init__(self, font: ImageFont.ImageFont):
+        left, top, right, bottom = font.getbbox(self.PREFIX + self.CHARS)
+        self.height = bottom - top
+        self.glyphs: Dict[str, Image.Image] = {}
+        for text in [self.PREFIX, *self.CHARS]:
+            glyph = Image.new("RGB", (round(font.getlength(text)), self.height), "black")
+            ImageDraw.Draw(glyph).text((0, -top), text, font=font, fill="yellow")
+            self.glyphs[text] = glyph
+
+    def render(self, time_left: str) -> Image.Image:
+        """Timer box for a "MM:SS" countdown"""
+        parts = [self.PREFIX, *(char for char in time_left if char in self.glyphs)]
+        width = sum(self.glyphs[part].width for part in parts)
+        box = Image.new(
+            "RGB", (width + 2 * self.MARGIN, self.height + 2 * self.MARGIN), "black"
+        )
+        x = self.MARGIN
+        for part in parts:
+            glyph = self.glyphs[part]
+            box.paste(glyph, (x, self.MARGIN))
+            x += glyph.width
+        return box
+
+
+@lru_cache(maxsize=None)
+def load_atlas() -> GlyphAtlas:
+    return GlyphAtlas(load_font())
+
+
+def paste_timer(img: Image.Image, box: Image.Image, scale: float = 1.0):
+    """Paste a timer box in the top right corner of `img`"""
+    if scale != 1.0:
+        box = box.resize(
+            (max(1, round(box.width * scale)), max(1, round(box.height * scale))),
+            Image.Resampling.BILINEAR,
+        )
+    margin = round(GlyphAtlas.MARGIN * scale)
+    img.paste(box, (img.width - box.width - margin, margin))
+
+
+def save(img: Image.Image, quality: int, format: str = JPEG, progressive: bool = False) -> bytes:
+    buffer = io.BytesIO()
+    if format == WEBP:
+        img.save(buffer, "WEBP", quality=quality, method=4)
+    else:
+        img.save(
+            buffer,
+            "JPEG",
+            quality=quality,
+            optimize=progressive,
+            progressive=progressive,
+        )
+    return buffer.getvalue()
+
+
+def encode(img: Image.Image, profile: EncodeProfile, max_quality: int = 100) -> bytes:
+    """Encode at the profile quality, or the highest one within its byte budget"""
+    quality = min(profile.quality, max_quality)
+    data = save(img, quality, profile.format, profile.progressive)
+    if not profile.max_bytes or len(data) <= profile.max_bytes:
+        return data
+    # Size shrinks with the quality, a bisection takes a few encodes at most
+    low, high = MIN_QUALITY, quality - 1
+    best = None
+    while low <= high:
+        middle = (low + high) // 2
+        candidate = save(img, middle, profile.format, profile.progressive)
+        if len(candidate) <= profile.max_bytes:
+            best, low = candidate, middle + 1
+        else:
+            data, high = candidate, middle - 1
+    # Over budget even at the lowest quality, the smallest try is still served
+    return best or data
+
+
+def resize(img: Image.Image, max_width: Optional[int]) -> Image.Image:
+    if max_width and img.width > max_width:
+        height = round(img.height * max_width / img.width)
+        return img.resize((max_width, height), Image.Resampling.BILINEAR)
+    return img
+
+
+def decode(raw: bytes, profiles: Iterable[EncodeProfile]) -> Dict[str, Image.Image]:
+    """Decode a camera image and resize it once for every profile"""
+    img = Image.open(io.BytesIO(raw))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return {profile.name: resize(img, profile.max_width) for profile in profiles}
+
+
+def compose(
+    bases: Dict[str, Image.Image],
+    time_left: str,
+    profiles: Iterable[EncodeProfile],
+    max_quality: int = 100,
+) -> Dict[str, bytes]:
+    """Overlay the countdown on copies of the decoded frames and encode them"""
+    box = load_atlas().render(time_left)
+    full_width = max(base.width for base in bases.values())
+    variants = {}
+    for profile in profiles:
+        img = bases[profile.name].copy()
+        paste_timer(img, box, scale=img.width / full_width)
+        variants[profile.name] = encode(img, profile, max_quality)
+    return variants
+
+
+def transcode(data: bytes, profile: EncodeProfile) -> bytes:
+    """Encode an already annotated frame again, smaller or in another format"""
+    img = Image.open(io.BytesIO(data))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return encode(resize(img, profile.max_width), profile)
+
+
+@lru_cache(maxsize=1024)
+def timer_png(time_left: str) -> bytes:
+    """The countdown box alone as a small PNG, each one is only drawn once"""
+    buffer = io.BytesIO()
+    load_atlas().render(time_left).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class FrameRenderer:
+    """
+    Runs the Pillow decode, overlay and encode pipeline in a bounded thread pool
+
+    Pillow releases the GIL while decoding and encoding, so a snapshot no
+    longer stalls the event loop of the single uvicorn worker. The last
+    decoded frame of each rover is kept, so that a new countdown only costs
+    pasting the timer box and encoding at `fast_quality`, at most once per
+    second of countdown.
+    """
+
+    def __init__(
+        self,
+        profiles: Iterable[EncodeProfile],
+        workers: int = 2,
+        fast_quality: int = 80,
+    ):
+        self.profiles = list(profiles)
+        self.workers = workers
+        self.fast_quality = fast_quality
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._bases: Dict[str, Dict[str, Image.Image]] = {}
+        # Decoded frame and countdown last drawn on it, by rover
+        self._drawn: Dict[str, Tuple[Dict[str, Image.Image], str]] = {}
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+
+    def start(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="frame-renderer"
+        )
+        # Load the font and glyphs up front rather than on the first snapshot
+        self._executor.submit(load_atlas)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def render(self, rover_id: str, raw: bytes, time_left: str) -> Dict[str, bytes]:
+        """Decode a new camera image of a rover and overlay the countdown"""
+        return await self._run(self._render, rover_id, raw, time_left)
+
+    async def retime(self, rover_id: str, time_left: str) -> Optional[Dict[str, bytes]]:
+        """
+        Overlay a new countdown on the last decoded frame of a rover
+
+        None without a decoded frame, or when this countdown is already drawn
+        on it: the latest frame is then still current.
+        """
+        bases = self._bases.get(rover_id)
+        if bases is None:
+            return None
+        drawn = self._drawn.get(rover_id)
+        if drawn is not None and drawn[0] is bases and drawn[1] == time_left:
+            return None
+        self._drawn[rover_id] = (bases, time_left)
+        return await self._run(compose, bases, time_left, self.profiles, self.fast_quality)
+
+    async def variant(self, key: Hashable, data: bytes, profile: EncodeProfile) -> bytes:
+        """
+        Encode an annotated frame again for a client, see `transcode`
+
+        Clients asking for the same `key` at once share a single encode.
+        """
+        return await coalesce(
+            self._pending, key, lambda: self._run(transcode, data, profile)
+        )
+
+    async def timer_png(self, time_left: str) -> bytes:
+        """The countdown box alone, see `timer_png`"""
+        return await self._run(timer_png, time_left)
+
+    def _render(self, rover_id: str, raw: bytes, time_left: str) -> Dict[str, bytes]:
+        bases = decode(raw, self.profiles)
+        self._bases[rover_id] = bases
+        self._drawn[rover_id] = (bases, time_left)
+        return compose(bases, time_left, self.profiles)
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            raise RuntimeError("The frame renderer is not started")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
@@ -1,8 +1,27 @@
-from fastapi import FastAPI, Request, HTTPException, Depends, BackgroundTasks
-from fastapi.responses import RedirectResponse, HTMLResponse, FileResponse
+import time
+
+# Taken before any other import, for the startup report
+STARTED_AT = time.perf_counter()
+
+from fastapi import (
+    FastAPI,
+    Request,
+    HTTPException,
+    Depends,
+    Query,
+    BackgroundTasks,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import (
+    RedirectResponse,
+    HTMLResponse,
+    FileResponse,
+    Response,
+    StreamingResponse,
+)
 from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import httpx
 import asyncio
@@ -11,21 +30,16 @@ import urllib.parse
 import uvicorn
 import logging
 from logging.handlers import RotatingFileHandler
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 import os
-import time
+import threading
 from typing import Dict, Optional
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Float
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-import uuid
+from sqlalchemy.ext.asyncio import AsyncSession
 import glob
 import json
-from PIL import Image, ImageDraw, ImageFont
+import csv
 import io
-from farcaster import Warpcast
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -42,21 +56,90 @@ env_path = BASE_DIR / ".env"
 load_dotenv(dotenv_path=env_path)
 
 
-PAYCASTER_API_URL = "https://app.paycaster.co/api/customs/"
-
 # Load environment variables
 load_dotenv()
 
 
 import helpers
+from clients import upstream
 from config import (
-    TUMBLLER_CAMERA_URLS,
     BASE_URL,
     ENV,
     FQDN,
-    TUMBLLER_BASE_URLS,
     FARCASTER_HOSTED_MANIFEST_URL,
+    FRAME_BUFFER_DEPTH,
+    PERSIST_FRAMES,
+    CAMERA_POLL_INTERVAL,
+    CAMERA_IDLE_INTERVAL,
+    STREAM_QUEUE_SIZE,
+    IMAGE_QUALITY,
+    THUMBNAIL_WIDTH,
+    THUMBNAIL_QUALITY,
+    IMAGE_WORKERS,
+    RETIME_QUALITY,
+    PROGRESSIVE_JPEG,
+    VARIANT_QUALITY,
+    VARIANT_MAX_BYTES,
+    WEBP_FRAMES,
+    SESSION_STORE,
+    USERNAME_CACHE_SIZE,
+    USERNAME_CACHE_TTL,
+    USERNAME_LOOKUP_TIMEOUT,
+    USERNAME_LOOKUP_WORKERS,
+    WARPCAST_API_URL,
+    WARPCAST_TIMEOUT,
+    PAYCASTER_API_URL,
+    PAYCASTER_CACHE_TTL,
+    COMMAND_QUEUE_SIZE,
+    COMMAND_DEADLINE,
+    COMMAND_TIMEOUT,
+    HEALTH_CHECK_INTERVAL,
+    HEALTH_CHECK_TIMEOUT,
+    HEALTH_FAILURE_THRESHOLD,
+    HEALTH_RESET_TIMEOUT,
+    FLEET_CONFIG,
+    STARTUP_CONCURRENCY,
+    default_stream_url,
+    RESERVATION_CLAIM_WINDOW,
+    RESERVATION_GRACE,
+    STARTUP_BUDGET,
+)
+from assets import IMMUTABLE, CachedStaticFiles
+from camera import CameraPoller
+from events import Event, EventHub, SessionWatcher
+from fleet import Fleet
+from health import HealthMonitor
+from idempotency import IdempotentResults
+from metrics import (
+    CAMERA_FETCH_SECONDS,
+    CONTENT_TYPE,
+    FRAME_RENDER_SECONDS,
+    Gauge,
+    MOTOR_COMMAND_SECONDS,
+    MetricsMiddleware,
+    REGISTRY,
 )
+from database import (
+    async_engine,
+    get_async_db,
+    transactions_query,
+    AsyncSessionLocal,
+    TransactionWriter,
+)
+from frames import BOOT_ID, FULL, Frame, FrameBuffer
+from imaging import JPEG, MEDIA_TYPES, WEBP, EncodeProfile, FrameRenderer, snap_width
+from paycaster import BUTTON_TARGET, OG_IMAGE, PayCasterClient
+from reservations import ReservationQueue
+from shells import TemplateShells
+from sessions import MemorySessionStore, RoverControl, SQLiteSessionStore
+from teleop import CommandCoalescer, CommandDispatcher
+from stream import MULTIPART_BOUNDARY, StreamRelay, multipart_chunk
+from startup import StartupReport
+from usernames import UsernameResolver
+from warpcast import create_client as create_warpcast_client
+
+startup_report = StartupReport(budget=STARTUP_BUDGET, started_at=STARTED_AT)
+startup_report.mark("imports")
 
 
 API_KEY = os.getenv("API_KEY")
@@ -71,14 +154,12 @@ else:
 TOKEN = "usdc"
 AMOUNT = 1
 
-
-# Database setup
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+# The rovers served, looked up by id everywhere
+fleet = Fleet.from_config(
+    FLEET_CONFIG, session_duration=SESSION_DURATION, stream_url=default_stream_url
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+PAYMENT_RECEIVER = "infinity-rover"
+
 
 # Create logs directory if it doesn't exist
 LOGS_DIR = BASE_DIR / "logs"
@@ -143,23 +224,76 @@ MNEMONIC_ENV_VAR = os.getenv("MNEMONIC_ENV_VAR")
 if not MNEMONIC_ENV_VAR:
     raise ValueError("MNEMONIC_ENV_VAR not found in .env file")
 
-# Create Warpcast client with mnemonic
-try:
-    warpcast_client = Warpcast(mnemonic=MNEMONIC_ENV_VAR)
-    logger.info("Successfully initialized Warpcast client")
-except Exception as e:
-    logger.error(f"Failed to initialize Warpcast client: {e}")
-    raise
+# The Warpcast client is slow to import and create, it authenticates with the
+# mnemonic, so it is only created on the first lookup or by the warm-up
+warpcast_client = None
+warpcast_lock = threading.Lock()
 
 
-# Add function to get latest image for a rover
-def get_latest_rover_image(rover_id: str) -> str:
-    """Get the most recent image file for given rover ID"""
-    pattern = str(Path(BASE_DIR, "static", f"image{rover_id}-*.jpg"))
-    files = glob.glob(pattern)
-    if not files:
-        return None
-    return max(files, key=os.path.getctime)
+def get_warpcast_client():
+    """
+    The Warpcast client, created once, from the threads of the lookups
+
+    It authenticates outside of the lock, so that no thread waits on another
+    one's network calls: should two threads race, the first client is kept.
+    """
+    global warpcast_client
+    if warpcast_client is not None:
+        return warpcast_client
+    try:
+        client = create_warpcast_client(
+            MNEMONIC_ENV_VAR, WARPCAST_API_URL, timeout=WARPCAST_TIMEOUT
+        )
+    except Exception as e:
+        logger.error(f"Failed to initialize Warpcast client: {e}")
+        raise
+    with warpcast_lock:
+        if warpcast_client is None:
+            warpcast_client = client
+            logger.info("Successfully initialized Warpcast client")
+        return warpcast_client
+
+
+username_resolver = UsernameResolver(
+    lookup=lambda fid: get_warpcast_client().get_user(fid).username,
+    max_size=USERNAME_CACHE_SIZE,
+    ttl=USERNAME_CACHE_TTL,
+    timeout=USERNAME_LOOKUP_TIMEOUT,
+    workers=USERNAME_LOOKUP_WORKERS,
+)
+
+
+# Latest encoded frames of each rover, served from memory
+frame_buffers: Dict[str, FrameBuffer] = {
+    rover_id: FrameBuffer(FRAME_BUFFER_DEPTH) for rover_id in fleet
+}
+DEFAULT_IMAGE = Path(BASE_DIR, "static", "tumbllerImage.jpg")
+
+# Seconds between comments sent on idle event streams
+EVENTS_KEEPALIVE = 15
+
+# Full size frames for the viewer, thumbnails for frame embeds
+THUMBNAIL = "thumb"
+frame_renderer = FrameRenderer(
+    profiles=[
+        EncodeProfile(FULL, quality=IMAGE_QUALITY, progressive=PROGRESSIVE_JPEG),
+        EncodeProfile(
+            THUMBNAIL,
+            quality=THUMBNAIL_QUALITY,
+            max_width=THUMBNAIL_WIDTH,
+            progressive=PROGRESSIVE_JPEG,
+        ),
+    ],
+    workers=IMAGE_WORKERS,
+    fast_quality=RETIME_QUALITY,
+)
+
+
+def persist_frame(rover_id: str, frame: Frame):
+    """Write a frame to static/, only when PERSIST_FRAMES is enabled"""
+    image_path = Path(BASE_DIR, "static", f"image{rover_id}-{frame.seq}.jpg")
+    image_path.write_bytes(frame.data)
+    clean_old_images(rover_id, keep_latest=FRAME_BUFFER_DEPTH)
 
 
 def clean_old_images(rover_id: str, keep_latest: int = 5):
@@ -180,98 +314,36 @@ def clean_old_images(rover_id: str, keep_latest: int = 5):
 
 async def take_picture(rover_id: str) -> bool:
     """Take a picture from the specified rover's camera and add time left text"""
+    camera = health_monitor[rover_id].camera
+    if not camera.allow():
+        # Pages get the default image rather than waiting for a dead camera
+        logger.debug(f"Skipping picture of Rover {rover_id}, its camera is down")
+        return False
     try:
-        camera_url = TUMBLLER_CAMERA_URLS[rover_id]
-        async with httpx.AsyncClient() as client:
-            response = await client.get(camera_url)
-            response.raise_for_status()
-
-            # Convert response content to image
-            image_bytes = io.BytesIO(response.content)
-            img = Image.open(image_bytes)
-
-            # Convert to RGB if needed
-            if img.mode != "RGB":
-                img = img.convert("RGB")
-
-            # Create drawing object
-            draw = ImageDraw.Draw(img)
-
-            # Get time left and log it
-            time_left = rover_controls[rover_id].get_time_left()
-            text = f"Time left: {time_left}"
-            logger.info(f"Adding text to image: {text}")
-
-            # Try common Linux font paths
-            font_paths = [
-                "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-                "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf",
-                "/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf",
-            ]
-
-            font = None
-            for font_path in font_paths:
-                try:
-                    font = ImageFont.truetype(font_path, size=60)
-                    logger.info(f"Successfully loaded font from: {font_path}")
-                    break
-                except IOError as e:
-                    logger.warning(f"Could not load font from {font_path}: {e}")
-                    continue
+        start = time.monotonic()
+        try:
+            response = await upstream.camera.get(fleet[rover_id].camera_url)
+        except httpx.RequestError:
+            camera.record_failure()
+            raise
+        elapsed = time.monotonic() - start
+        camera.record_success(elapsed)
+        CAMERA_FETCH_SECONDS.observe(elapsed, rover_id)
+        response.raise_for_status()
 
-            if font is None:
-                logger.warning("No TrueType font found, using default")
-                font = ImageFont.load_default()
-
-            # Get text size
-            text_box = draw.textbbox((0, 0), text, font=font)
-            text_width = text_box[2] - text_box[0]
-            text_height = text_box[3] - text_box[1]
-
-            # Position text in top right with larger padding
-            padding = 20
-            x = img.width - text_width - padding
-            y = padding
-
-            logger.info(f"Text dimensions: {text_width}x{text_height}")
-            logger.info(f"Text position: ({x}, {y})")
-
-            # Draw black background rectangle for better visibility
-            background_padding = 10
-            draw.rectangle(
-                [
-                    (x - background_padding, y - background_padding),
-                    (
-                        x + text_width + background_padding,
-                        y + text_height + background_padding,
-                    ),
-                ],
-                fill="black",
+        # Decode, draw the time left and encode off the event loop
+        time_left = rover_controls[rover_id].get_time_left()
+        with FRAME_RENDER_SECONDS.time("capture"):
+            variants = await frame_renderer.render(
+                rover_id, response.content, time_left
             )
+        frame = push_frame(rover_id, variants)
 
-            # Draw text multiple times for thicker appearance
-            for offset in [(2, 2), (-2, -2), (2, -2), (-2, 2)]:
-                draw.text((x + offset[0], y + offset[1]), text, font=font, fill="black")
-
-            # Draw main text
-            draw.text((x, y), text, font=font, fill="yellow")
-
-            # Generate new UUID for the image
-            image_uuid = str(uuid.uuid4())
-            image_path = Path(BASE_DIR, "static", f"image{rover_id}-{image_uuid}.jpg")
-            image_path.parent.mkdir(parents=True, exist_ok=True)
+        if PERSIST_FRAMES:
+            await asyncio.to_thread(persist_frame, rover_id, frame)
 
-            # Save as JPEG with high quality
-            img.save(image_path, "JPEG", quality=95)
-            logger.info(f"Saved image with text at: {image_path}")
-
-            # Clean up old images
-            clean_old_images(rover_id)
-
-            logger.info(
-                f"Took picture for Rover {rover_id} at {datetime.now()} with UUID {image_uuid}"
-            )
-            return True
+        logger.debug(f"Took picture for Rover {rover_id} with sequence {frame.seq}")
+        return True
 
     except Exception as e:
         logger.error(f"Error taking picture for Rover {rover_id}: {e}")
@@ -279,47 +351,116 @@ async def take_picture(rover_id: str) -> bool:
         return False
 
 
-def get_image_url(base_url: str, rover_id: str) -> str:
+def push_frame(rover_id: str, variants: Dict[str, bytes]) -> Frame:
+    """Add a frame to the buffer of a rover and tell the pages showing it"""
+    frame = frame_buffers[rover_id].push(variants)
+    event_hub.publish(
+        rover_id, "frame", seq=frame.seq, url=get_image_url(BASE_URL, rover_id)
+    )
+    return frame
+
+
+def latest_frame(rover_id: str) -> Optional[Frame]:
+    """The latest frame of a rover, none while its camera is down"""
+    if not health_monitor[rover_id].camera.allow():
+        return None
+    return frame_buffers[rover_id].latest()
+
+
+def get_image_url(base_url: str, rover_id: str, size: str = FULL) -> str:
     """Get URL for the latest image of the specified rover"""
-    latest_image = get_latest_rover_image(rover_id)
-    if latest_image:
-        # Extract just the filename from the full path
-        image_filename = os.path.basename(latest_image)
-        return f"/static/{image_filename}"
+    frame = latest_frame(rover_id)
+    if frame:
+        if size != FULL:
+            return f"/v1/rover/{rover_id}/frame/{BOOT_ID}/{frame.seq}.jpg?size={size}"
+        return f"/v1/rover/{rover_id}/frame/{BOOT_ID}/{frame.seq}.jpg"
     else:
         # Fallback to default image
-        return f"/static/tumbllerImage.jpg"
+        return static_url("tumbllerImage.jpg")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown events"""
-    # Startup: Take initial pictures
-    logger.info("Starting up: Taking initial pictures")
-    for rover_id in ["A", "B"]:
-        success = await take_picture(rover_id)
-        if not success:
-            logger.error(f"Failed to take initial picture for Rover {rover_id}")
-            # Copy default image if available
-            default_image = Path(BASE_DIR, "static", "tumbllerImage.jpg")
-            if default_image.exists():
-                target_image = Path(BASE_DIR, "static", f"image{rover_id}.jpg")
-                target_image.write_bytes(default_image.read_bytes())
+    startup_report.mark("setup")
+    upstream.start(rovers=len(fleet))
+    frame_renderer.start()
+    username_resolver.start()
+    transaction_writer.start()
+    # Digest the static files off the event loop before pages link them
+    await static_files.load_versions()
+
+    camera_poller.start(frame_buffers)
+    session_watcher.start()
+    health_monitor.start()
+    command_dispatcher.start(fleet)
+    paycaster.start_prewarm()
+    # Requests are served right away, with the default image until then
+    warm_up_task = asyncio.create_task(warm_up(), name="warm-up")
+    startup_report.mark("lifespan")
+    startup_report.log()
 
     yield  # Runtime: FastAPI runs here
 
-    # Shutdown: Nothing specific needed for cleanup
+    # Shutdown: Stop background capture and release pooled upstream connections
     logger.info("Shutting down")
+    warm_up_task.cancel()
+    await asyncio.gather(warm_up_task, return_exceptions=True)
+    await camera_poller.stop()
+    await session_watcher.stop()
+    await health_monitor.stop()
+    await command_dispatcher.stop()
+    await stream_relay.stop()
+    await paycaster.stop()
+    await upstream.aclose()
+    frame_renderer.shutdown()
+    username_resolver.shutdown()
+    await transaction_writer.stop()
+    await async_engine.dispose()
+
+
+async def warm_up():
+    """Take the first pictures, a few rovers at a time, and create the Warpcast client"""
+    start = time.perf_counter()
+    startup_slots = asyncio.Semaphore(STARTUP_CONCURRENCY)
+
+    async def initial_picture(rover_id: str):
+        async with startup_slots:
+            success = await take_picture(rover_id)
+        if not success:
+            # Pages fall back to the default image until a frame is captured
+            logger.error(f"Failed to take initial picture for Rover {rover_id}")
+
+    async def warpcast():
+        try:
+            await username_resolver.run(get_warpcast_client)
+        except Exception:
+            # Logged already, the first lookup will try again
+            pass
+
+    await asyncio.gather(
+        warpcast(), *(initial_picture(rover_id) for rover_id in fleet)
+    )
+    logger.info(f"Warmed up in {(time.perf_counter() - start) * 1000:.0f}ms")
 
 
 # Initialize FastAPI with lifespan
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 # app = FastAPI()
 
-# Mount static files and templates
-app.mount("/static", StaticFiles(directory=Path(BASE_DIR, "static")), name="static")
+# Static files are mounted last, see the end of this module
+static_files = CachedStaticFiles(directory=Path(BASE_DIR, "static"))
+
+
+def static_url(name: str) -> str:
+    """URL of a static file, versioned by its content so it is cached for good"""
+    return f"/static/{name}?v={static_files.version(name)}"
+
+
 templates = Jinja2Templates(directory=Path(BASE_DIR, "templates"))
+templates.env.globals["static_url"] = static_url
 logger.debug(f"Templates directory: {Path(BASE_DIR, 'templates')}")
 
 
@@ -330,76 +471,119 @@ def datetime_filter(timestamp: float) -> str:
 
 templates.env.filters["datetime"] = datetime_filter
 
+# Control and waiting screens only change by rover, time left and image, and
+# for the waiting screen by place in the queue
+shells = TemplateShells(
+    templates,
+    dynamic=(
+        "time_left",
+        "fc_frame_image",
+        "user_fid",
+        "reservation",
+        "ticket",
+        "position",
+        "eta",
+    ),
+)
 
-class Transaction(Base):
-    __tablename__ = "transactions"
 
-    id = Column(Integer, primary_key=True, index=True)
-    transaction_id = Column(String, unique=True, index=True)
-    user = Column(String)
-    rover_id = Column(String)
-    timestamp = Column(Float)
+paycaster = PayCasterClient(
+    get_client=lambda: upstream.paycaster,
+    api_url=PAYCASTER_API_URL,
+    api_key=API_KEY,
+    ttl=PAYCASTER_CACHE_TTL,
+)
 
+# Payment callbacks arriving in bursts are committed together
+transaction_writer = TransactionWriter()
+# Replayed payment callbacks get the outcome of the first one that started
+callback_results = IdempotentResults()
+# Transactions paid while the rover was busy, by rover and FID of the payer:
+# their session starts on a retry of the callback or when their claim comes
+unstarted_payments: Dict[str, Dict[str, str]] = {
+    rover.id: {} for rover in fleet.rovers()
+}
+
+# Initialize rover controls, sessions are shared between workers with SQLite
+if SESSION_STORE == "sqlite":
+    session_store = SQLiteSessionStore(async_engine)
+else:
+    session_store = MemorySessionStore()
+rover_controls: Dict[str, RoverControl] = {
+    rover.id: RoverControl(
+        rover.id,
+        session_store,
+        rover.session_duration,
+        on_change=lambda rover_id: session_watcher.poke(rover_id),
+    )
+    for rover in fleet.rovers()
+}
 
-Base.metadata.create_all(bind=engine)
+# Availability, session and frame changes pushed to the pages over SSE
+event_hub = EventHub()
 
 
-# Database dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-class RoverControl:
-    def __init__(self):
-        self.transaction_id: Optional[str] = None
-        self.start_time: float = 0
-        self.user: Optional[str] = None
-        self.session_duration: int = SESSION_DURATION
-
-    def is_available(self) -> bool:
-        if not self.transaction_id:
-            return True
-        return time.time() - self.start_time > self.session_duration
-
-    def start_session(self, transaction_id: str, user: str):
-        self.transaction_id = transaction_id
-        self.start_time = time.time()
-        self.user = user
-
-    def get_time_left(self, raw: bool = False) -> str | int:
-        """
-        Returns a formated string by default, e.g. 03:45
-
-        With `raw` set to True, returns the number of
-        seconds remaining, as an integer.
-        """
-        if not self.transaction_id:
-            if raw:
-                return 0
-            else:
-                return "00:00"
-        elapsed = time.time() - self.start_time
-        remaining = self.session_duration - elapsed
-        remaining = max(0, int(remaining))
-        if raw:
-            return remaining
-        else:
-            minutes = remaining // 60
-            seconds = remaining % 60
-            return f"{minutes:02d}:{seconds:02d}"
+def queue_state(rover_id: str) -> Dict:
+    """Where the queue of a rover stands, waiters find themselves by ticket"""
+    return {
+        "tickets": reservations.tickets(rover_id),
+        "claimant": reservations.claimant(rover_id),
+        "time_left": rover_controls[rover_id].get_time_left(raw=True),
+        "session_duration": rover_controls[rover_id].session_duration,
+    }
+
 
-    def clear_session(self):
-        self.transaction_id = None
-        self.start_time = 0
-        self.user = None
+def publish_queue(rover_id: str):
+    event_hub.publish(rover_id, "queue", **queue_state(rover_id))
 
 
-# Initialize rover controls
-rover_controls: Dict[str, RoverControl] = {"A": RoverControl(), "B": RoverControl()}
+# Busy rovers are handed over to their waiters in order
+reservations = ReservationQueue(
+    claim_window=RESERVATION_CLAIM_WINDOW,
+    grace=RESERVATION_GRACE,
+    on_change=publish_queue,
+)
+session_watcher = SessionWatcher(
+    event_hub,
+    rover_controls,
+    on_check=reservations.update,
+    describe=lambda rover_id: selection_state(rover_id),
+)
+
+# Offline rovers are skipped instead of tying requests up until they time out
+health_monitor = HealthMonitor(
+    get_camera_client=lambda: upstream.camera,
+    get_motor_client=lambda: upstream.motor,
+    camera_urls=fleet.urls("camera_url"),
+    motor_urls=fleet.urls("motor_url"),
+    interval=HEALTH_CHECK_INTERVAL,
+    timeout=HEALTH_CHECK_TIMEOUT,
+    failure_threshold=HEALTH_FAILURE_THRESHOLD,
+    reset_timeout=HEALTH_RESET_TIMEOUT,
+)
+
+# Frames are captured in the background, faster while a rover is in session
+camera_poller = CameraPoller(
+    capture=take_picture,
+    is_active=lambda rover_id: not rover_controls[rover_id].is_available(),
+    active_interval=CAMERA_POLL_INTERVAL,
+    idle_interval=CAMERA_IDLE_INTERVAL,
+)
+
+# Motor commands go to each rover one at a time, a stop jumping the queue
+command_dispatcher = CommandDispatcher(
+    send=lambda rover_id, command: send_tumbller_command(rover_id, command),
+    queue_size=COMMAND_QUEUE_SIZE,
+    deadline=COMMAND_DEADLINE,
+    timeout=COMMAND_TIMEOUT,
+)
+
+# Live camera streams, one upstream connection per rover shared by all viewers
+stream_relay = StreamRelay(
+    get_client=lambda: upstream.stream,
+    stream_urls=fleet.urls("stream_url"),
+    queue_size=STREAM_QUEUE_SIZE,
+)
 
 
 # Routes
@@ -436,12 +620,11 @@ async def root_post(request: Request):
 
         logger.info(f"Root POST received FID: {user_fid}")
 
-        return templates.TemplateResponse(
+        return shells.render(
             "rover_selection.html",
             {
                 "request": request,
-                "rover_a_available": rover_controls["A"].is_available(),
-                "rover_b_available": rover_controls["B"].is_available(),
+                "rovers": await fleet_availability(),
                 "user_fid": user_fid,  # Pass the FID to the template
             },
         )
@@ -453,16 +636,39 @@ async def root_post(request: Request):
 
 async def root_handler(request: Request):
     """Common handler for both GET and POST requests"""
-    return templates.TemplateResponse(
+    return shells.render(
         "rover_selection.html",
         {
             "request": request,
-            "rover_a_available": rover_controls["A"].is_available(),
-            "rover_b_available": rover_controls["B"].is_available(),
+            "rovers": await fleet_availability(),
         },
     )
 
 
+async def fleet_availability() -> tuple:
+    """(rover_id, selectable) of every rover, in display order"""
+    await asyncio.gather(*(rover.load() for rover in rover_controls.values()))
+    return tuple((rover_id, is_selectable(rover_id)) for rover_id in fleet)
+
+
+def is_selectable(rover_id: str) -> bool:
+    """Free, reachable and nobody queued for it"""
+    return (
+        rover_controls[rover_id].is_available()
+        and health_monitor.is_healthy(rover_id)
+        and reservations.is_open(rover_id)
+    )
+
+
+def selection_state(rover_id: str) -> Dict:
+    """What the selection page needs to enable or disable a rover"""
+    return {
+        "selectable": is_selectable(rover_id),
+        "healthy": health_monitor.is_healthy(rover_id),
+        "queued": not reservations.is_open(rover_id),
+    }
+
+
 @app.post("/v1/select_rover/{rover_id}")
 async def select_rover(rover_id: str, request: Request):
     """Handle rover selection with FID to username conversion"""
@@ -470,6 +676,10 @@ async def select_rover(rover_id: str, request: Request):
         if rover_id not in rover_controls:
             raise HTTPException(status_code=400, detail="Invalid rover selection")
 
+        if not health_monitor.is_healthy(rover_id):
+            logger.warning(f"Rover {rover_id} is offline, back to the selection")
+            return await root_handler(request)
+
         form = await request.form()
 
         user_fid = form.get("fid")
@@ -483,24 +693,38 @@ async def select_rover(rover_id: str, request: Request):
         else:
             payment = True
 
-        try:
-            # Get user details from Farcaster
-            user = warpcast_client.get_user(user_fid)
-            sender = user.username
-            logger.info(f"Resolved FID {user_fid} to username: {sender}")
-        except Exception as e:
-            logger.error(f"Error getting username for FID {user_fid}: {e}")
-            # Fall back to using FID if username lookup fails
+        # Get the username from Farcaster, falling back to the FID
+        if user_fid:
+            sender = await username_resolver.resolve(user_fid)
+        else:
             sender = str(user_fid)
 
-        if rover_controls[rover_id].is_available():
-            logger.debug(f"Rover {rover_id} available and acquired")
-            if payment:
+        # A free rover goes to whoever holds the claim on it, if anyone does
+        token = form.get("reservation") or None
+        await rover_controls[rover_id].load()
+        available = rover_controls[rover_id].is_available()
+        reservations.update(rover_id, available)
+        if available and not reservations.may_take(rover_id, token):
+            token = reservations.held_by(rover_id, user_fid) or token
+
+        if available and reservations.may_take(rover_id, token):
+            # A payer who already paid while the rover was busy does not pay twice
+            paid = unstarted_payments[rover_id].get(user_fid) if user_fid else None
+            if paid:
+                started = await process_payment(rover_id, paid, user_fid)
+            elif payment:
+                logger.debug(f"Rover {rover_id} available, requesting payment")
                 return await pay(rover_id=rover_id, request=request, user_fid=sender)
             else:
-                rover_controls[rover_id].start_session("development", user_fid)
-                await take_picture(rover_id)
-                return templates.TemplateResponse(
+                started = await rover_controls[rover_id].start_session(
+                    "development", user_fid
+                )
+                if started:
+                    camera_poller.wake(rover_id)
+            if started:
+                logger.debug(f"Rover {rover_id} available and acquired")
+                reservations.release(rover_id, token)
+                return shells.render(
                     "control_mode.html",
                     {
                         "request": request,
@@ -511,24 +735,56 @@ async def select_rover(rover_id: str, request: Request):
                         "end_url": "/v1",
                     },
                 )
-        else:
-            logger.debug(f"Rover {rover_id} not available. Redirecting to wait screen")
-            time_left = rover_controls[rover_id].get_time_left(raw=True)
-            return templates.TemplateResponse(
-                "waiting.html",
-                {
-                    "request": request,
-                    "fc_frame_image": f"/static/tumbllerImage.jpg",
-                    "base_url": BASE_URL,
-                    "rover_id": rover_id,
-                    "time_left": time_left,
-                },
-            )
+
+        logger.debug(f"Rover {rover_id} not available. Redirecting to wait screen")
+        return waiting_page(
+            request,
+            rover_id,
+            user_fid,
+            token,
+            fc_frame_image=static_url("tumbllerImage.jpg"),
+            base_url=BASE_URL,
+        )
     except Exception as e:
         logger.error(f"Error in select_rover: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+def waiting_page(
+    request: Request,
+    rover_id: str,
+    user_fid: Optional[str],
+    token: Optional[str] = None,
+    **context,
+) -> Response:
+    """The waiting page of a rover, queueing up `user_fid` or the holder of `token`"""
+    time_left = rover_controls[rover_id].get_time_left(raw=True)
+    session_duration = rover_controls[rover_id].session_duration
+    waiting = {"reservation": "", "ticket": "", "position": "", "eta": time_left}
+    # Without a FID, only a place already held is kept: every retry of an
+    # anonymous call would otherwise queue up again
+    if user_fid or reservations.position(rover_id, token) is not None:
+        reservation = reservations.join(rover_id, holder=user_fid, token=token)
+        position = reservations.position(rover_id, reservation.token)
+        waiting = {
+            "reservation": reservation.token,
+            "ticket": reservation.ticket,
+            "position": position,
+            "eta": time_left + max(0, position - 1) * session_duration,
+        }
+    return shells.render(
+        "waiting.html",
+        {
+            "request": request,
+            "rover_id": rover_id,
+            "time_left": time_left,
+            "user_fid": user_fid or "",
+            **waiting,
+            **context,
+        },
+    )
+
+
 @app.post("/pay/{rover_id}")
 async def pay(rover_id: str, request: Request, user_fid: str):
     """Payment initiation endpoint"""
@@ -537,81 +793,57 @@ async def pay(rover_id: str, request: Request, user_fid: str):
 
         # Use the provided FID directly as sender
         sender = user_fid
-        receiver = "infinity-rover"
 
         # Construct the callback URL
         callback_url = f"{BASE_URL}/callback/{rover_id}"
 
-        # Construct query parameters
-        query_params = {
-            "key": API_KEY,
-            "sender": sender,  # This will be the FID from untrustedData
-            "amount": AMOUNT,
-            "token": TOKEN,
-            "receiver": receiver,
-            "callback": callback_url,
-        }
-
-        logger.debug(f"PayCaster query params: {query_params}")
+        try:
+            meta = await paycaster.frame_metadata(
+                rover_id=rover_id,
+                sender=sender,
+                amount=AMOUNT,
+                token=TOKEN,
+                receiver=PAYMENT_RECEIVER,
+                callback=callback_url,
+            )
 
-        async with httpx.AsyncClient(follow_redirects=True) as client:
-            try:
-                response = await client.get(
-                    PAYCASTER_API_URL,
-                    params=query_params,
-                    timeout=30.0,
-                    headers={
-                        "Accept": "text/html,application/xhtml+xml",
-                        "User-Agent": "Mozilla/5.0 FastAPI/0.95.0",
-                    },
-                )
+            frame_data = {
+                "og_title": "Pay for Rover Control",
+                "fc_frame": "vNext",
+                "fc_frame_image": meta.get(OG_IMAGE)
+                or f"{BASE_URL}{static_url('tumbllerImage.jpg')}",
+                "fc_frame_button": "Pay 1 USDC",
+                "fc_frame_button_action": "tx",
+                "fc_frame_button_target": meta.get(BUTTON_TARGET),
+                "fc_frame_post_url": callback_url,
+            }
 
-                response.raise_for_status()
+            logger.debug(f"Frame data prepared: {frame_data}")
 
-                soup = BeautifulSoup(response.text, "html.parser")
+            return templates.TemplateResponse(
+                "payment_frame.html",
+                {
+                    "request": request,
+                    **frame_data,
+                    "rover_id": rover_id,
+                    "user_fid": user_fid,  # Pass the FID to the template
+                },
+            )
 
-                frame_data = {
-                    "og_title": "Pay for Rover Control",
+        except httpx.HTTPStatusError as e:
+            logger.error(f"PayCaster HTTP error: {e}")
+            return templates.TemplateResponse(
+                "payment_frame.html",
+                {
+                    "request": request,
+                    "og_title": "Payment Error",
                     "fc_frame": "vNext",
-                    "fc_frame_image": soup.find("meta", property="og:image")["content"]
-                    if soup.find("meta", property="og:image")
-                    else f"{BASE_URL}/static/tumbllerImage.jpg",
-                    "fc_frame_button": "Pay 1 USDC",
-                    "fc_frame_button_action": "tx",
-                    "fc_frame_button_target": soup.find(
-                        "meta", attrs={"name": "fc:frame:button:1:target"}
-                    )["content"]
-                    if soup.find("meta", attrs={"name": "fc:frame:button:1:target"})
-                    else None,
-                    "fc_frame_post_url": callback_url,
-                }
-
-                logger.debug(f"Frame data prepared: {frame_data}")
-
-                return templates.TemplateResponse(
-                    "payment_frame.html",
-                    {
-                        "request": request,
-                        **frame_data,
-                        "rover_id": rover_id,
-                        "user_fid": user_fid,  # Pass the FID to the template
-                    },
-                )
-
-            except httpx.HTTPStatusError as e:
-                logger.error(f"PayCaster HTTP error: {e}")
-                return templates.TemplateResponse(
-                    "payment_frame.html",
-                    {
-                        "request": request,
-                        "og_title": "Payment Error",
-                        "fc_frame": "vNext",
-                        "fc_frame_image": f"{BASE_URL}/static/tumbllerImage.jpg",
-                        "fc_frame_button": "Try Again",
-                        "fc_frame_post_url": f"{BASE_URL}/",
-                        "error_message": "Payment service temporarily unavailable",
-                    },
-                )
+                    "fc_frame_image": f"{BASE_URL}{static_url('tumbllerImage.jpg')}",
+                    "fc_frame_button": "Try Again",
+                    "fc_frame_post_url": f"{BASE_URL}/",
+                    "error_message": "Payment service temporarily unavailable",
+                },
+            )
 
     except Exception as e:
         logger.error(f"Error in pay endpoint: {str(e)}", exc_info=True)
@@ -621,7 +853,7 @@ async def pay(rover_id: str, request: Request, user_fid: str):
                 "request": request,
                 "og_title": "Error",
                 "fc_frame": "vNext",
-                "fc_frame_image": f"{BASE_URL}/static/tumbllerImage.jpg",
+                "fc_frame_image": f"{BASE_URL}{static_url('tumbllerImage.jpg')}",
                 "fc_frame_button": "Try Again",
                 "fc_frame_post_url": f"{BASE_URL}/",
                 "error_message": "An error occurred",
@@ -629,10 +861,39 @@ async def pay(rover_id: str, request: Request, user_fid: str):
         )
 
 
+async def process_payment(rover_id: str, transaction_id: str, user: str) -> bool:
+    """Record a payment and start its session, returns whether it started"""
+    created = await transaction_writer.add(
+        transaction_id=transaction_id,
+        user=user,
+        rover_id=rover_id,
+        timestamp=time.time(),
+    )
+    unstarted = unstarted_payments[rover_id]
+    if not created and unstarted.get(user) != transaction_id:
+        # Replayed after a restart or by another worker, never a second session
+        logger.info(f"Transaction {transaction_id} was already processed")
+        state = await rover_controls[rover_id].load()
+        return state.transaction_id == transaction_id
+
+    # The claims of the queue are enforced when handing out the payment frame
+    # in select_rover: once paid, a free rover always starts the session
+    if await rover_controls[rover_id].start_session(transaction_id, user):
+        unstarted.pop(user, None)
+        # The payer no longer waits, whether they held the claim or not
+        place = reservations.place_of(rover_id, user)
+        if place is not None:
+            reservations.leave(rover_id, place.token)
+        # Refresh the picture in the background when session starts
+        camera_poller.wake(rover_id)
+        return True
+    logger.info(f"Rover {rover_id} is busy, transaction {transaction_id} waits in line")
+    unstarted[user] = transaction_id
+    return False
+
+
 @app.post("/callback/{rover_id}")
-async def transaction_callback(
-    rover_id: str, request: Request, db: Session = Depends(get_db)
-):
+async def transaction_callback(rover_id: str, request: Request):
     try:
         body = await request.body()
         logger.debug(f"Raw request body: {body}")
@@ -644,20 +905,16 @@ async def transaction_callback(
         user = frame_data.get("fid")  # This is where we get the FID
 
         if transaction_id and user:
-            new_transaction = Transaction(
-                transaction_id=transaction_id,
-                user=str(user),
-                rover_id=rover_id,
-                timestamp=time.time(),
+            # Only started sessions are replayed, a payer still waiting gets
+            # their place in the queue and a retry may start the session
+            started = await callback_results.run(
+                transaction_id,
+                lambda: process_payment(rover_id, transaction_id, str(user)),
+                keep=bool,
             )
-            db.add(new_transaction)
-            db.commit()
-
-            if rover_controls[rover_id].is_available():
-                rover_controls[rover_id].start_session(transaction_id, str(user))
-                # Take initial picture when session starts
-                await take_picture(rover_id)
-                return templates.TemplateResponse(
+
+            if started:
+                return shells.render(
                     "control_mode.html",
                     {
                         "request": request,
@@ -668,22 +925,19 @@ async def transaction_callback(
                     },
                 )
             else:
-                return templates.TemplateResponse(
-                    "waiting.html",
-                    {
-                        "request": request,
-                        "fc_frame_image": get_image_url(BASE_URL, rover_id),
-                        "base_url": f"{BASE_URL}/",
-                        "rover_id": rover_id,
-                        "time_left": rover_controls[rover_id].get_time_left(raw=True),
-                    },
+                return waiting_page(
+                    request,
+                    rover_id,
+                    str(user),
+                    fc_frame_image=get_image_url(BASE_URL, rover_id, THUMBNAIL),
+                    base_url=f"{BASE_URL}/",
                 )
         else:
             return templates.TemplateResponse(
                 "payment_failed.html",
                 {
                     "request": request,
-                    "fc_frame_image": f"{BASE_URL}/static/tumbllerImage.jpg",
+                    "fc_frame_image": f"{BASE_URL}{static_url('tumbllerImage.jpg')}",
                     "base_url": f"{BASE_URL}/",
                 },
             )
@@ -694,7 +948,7 @@ async def transaction_callback(
             "payment_failed.html",
             {
                 "request": request,
-                "fc_frame_image": f"{BASE_URL}/static/tumbllerImage.jpg",
+                "fc_frame_image": f"{BASE_URL}{static_url('tumbllerImage.jpg')}",
                 "base_url": f"{BASE_URL}/",
             },
         )
@@ -706,11 +960,11 @@ async def transaction_callback(
 @app.post("/v1/rover/{rover_id}/control/{mode}")
 async def control_mode(rover_id: str, mode: str, request: Request):
     """Handle specific control mode (fb or lr)"""
-    if not _validate_session(rover_id):
+    if not await _validate_session(rover_id):
         return await root_handler(request)
 
     template_name = "fb_control.html" if mode.lower() == "fb" else "lr_control.html"
-    return templates.TemplateResponse(
+    return shells.render(
         template_name,
         {
             "request": request,
@@ -725,16 +979,15 @@ async def control_mode(rover_id: str, mode: str, request: Request):
 @app.post("/v1/rover/{rover_id}/pic")
 async def take_rover_picture(rover_id: str, request: Request):
     """
-    Take new picture from rover's camera
-    Returns to the same frame user was on with new picture
+    Return the latest picture from rover's camera
+    The poller is woken up so that the next click gets a fresh frame
     """
-    if not _validate_session(rover_id):
+    if not await _validate_session(rover_id):
         return await root_handler(request)
 
-    success = await take_picture(rover_id)
-
-    # Get the URL for the newly taken picture
+    # Get the URL for the latest picture taken in the background
     image_url = get_image_url(BASE_URL, rover_id)
+    camera_poller.wake(rover_id)
 
     return {
         "fc_frame_image": image_url,
@@ -744,27 +997,29 @@ async def take_rover_picture(rover_id: str, request: Request):
 
 
 # Movement and Picture Commands
+# Motor commands of the Tumbller by direction
+MOVE_COMMANDS = {
+    "forward": "forward",
+    "backward": "back",
+    "left": "left",
+    "right": "right",
+    "stop": "stop",
+}
+
+
 @app.post("/v1/rover/{rover_id}/move/{direction}")
 async def move_rover(rover_id: str, direction: str, request: Request):
-    if not _validate_session(rover_id):
+    if not await _validate_session(rover_id):
         return await root_handler(request)
 
-    command_map = {
-        "forward": "forward",
-        "backward": "back",
-        "left": "left",
-        "right": "right",
-        "stop": "stop",
-    }
-
-    command = command_map.get(direction)
+    command = MOVE_COMMANDS.get(direction)
     if not command:
         raise HTTPException(status_code=400, detail="Invalid direction")
 
-    success, message = await send_tumbller_command(rover_id, command)
+    success, message = await command_dispatcher.dispatch(rover_id, command)
 
     if direction == "stop":
-        return templates.TemplateResponse(
+        return shells.render(
             "control_mode.html",
             {
                 "request": request,
@@ -778,7 +1033,7 @@ async def move_rover(rover_id: str, direction: str, request: Request):
         )
     else:
         mode = "fb" if direction in ["forward", "backward"] else "lr"
-        return templates.TemplateResponse(
+        return shells.render(
             f"{mode}_control.html",
             {
                 "request": request,
@@ -791,19 +1046,85 @@ async def move_rover(rover_id: str, direction: str, request: Request):
         )
 
 
+@app.websocket("/v1/rover/{rover_id}/ws")
+async def teleop(websocket: WebSocket, rover_id: str):
+    """
+    Drive a rover over a WebSocket
+
+    The client sends directions as text, e.g. "forward" or "stop", and gets
+    small JSON messages back: "ack" once a command reached the rover, "frame"
+    when a new frame is captured and "session" when the session is over.
+    """
+    await websocket.accept()
+    if not await _validate_session(rover_id):
+        await websocket.send_json({"type": "session", "active": False})
+        await websocket.close(code=1008)
+        return
+
+    async def send(direction: str):
+        return await command_dispatcher.dispatch(rover_id, MOVE_COMMANDS[direction])
+
+    async def ack(direction: str, success: bool, message: str):
+        await websocket.send_json(
+            {"type": "ack", "direction": direction, "ok": success, "message": message}
+        )
+
+    async def forward_events():
+        async for event in subscription:
+            if event.type in ("frame", "session"):
+                await websocket.send_json({"type": event.type, **event.data})
+
+    coalescer = CommandCoalescer(send, ack)
+    coalescer.start()
+    subscription = event_hub.subscribe([rover_id])
+    events_task = asyncio.create_task(forward_events())
+    try:
+        while True:
+            direction = (await websocket.receive_text()).strip()
+            if direction not in MOVE_COMMANDS:
+                await websocket.send_json({"type": "error", "message": "Invalid direction"})
+                continue
+            if not await _validate_session(rover_id):
+                await websocket.send_json({"type": "session", "active": False})
+                await websocket.close(code=1008)
+                break
+            coalescer.submit(direction)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        event_hub.unsubscribe([rover_id], subscription)
+        events_task.cancel()
+        await asyncio.gather(events_task, return_exceptions=True)
+        await coalescer.stop()
+        if coalescer.coalesced:
+            logger.info(f"Coalesced {coalescer.coalesced} commands of Rover {rover_id}")
+
+
 async def send_tumbller_command(rover_id: str, command: str):
     """Send command to Tumbller device"""
-    url = f"{TUMBLLER_BASE_URLS[rover_id]}/motor/{command}"
-    logger.info(f"Attempting to send command to URL: {url}")
+    url = f"{fleet[rover_id].motor_url}/motor/{command}"
+    logger.debug(f"Attempting to send command to URL: {url}")
+
+    motor = health_monitor[rover_id].motor
+    if not motor.allow():
+        logger.warning(f"Not sending {command} command, Tumbller {rover_id} is down")
+        return False, f"Tumbller {rover_id} is offline"
 
     try:
-        async with httpx.AsyncClient() as client:
-            logger.info(f"Sending {command} command to {url}")
-            response = await client.get(url, timeout=10.0)
-            logger.info(
-                f"Sent {command} command to Rover {rover_id}. Response: {response.status_code}"
-            )
-            logger.info(f"Response content: {response.text}")
+        logger.debug(f"Sending {command} command to {url}")
+        start = time.monotonic()
+        try:
+            response = await upstream.motor.get(url)
+        except httpx.RequestError:
+            motor.record_failure()
+            raise
+        elapsed = time.monotonic() - start
+        motor.record_success(elapsed)
+        MOTOR_COMMAND_SECONDS.observe(elapsed, rover_id, command)
+        logger.info(
+            f"Sent {command} command to Rover {rover_id}. Response: {response.status_code}"
+        )
+        logger.debug(f"Response content: {response.text}")
         response.raise_for_status()
         return True, "Command sent successfully"
     except httpx.TimeoutException:
@@ -822,81 +1143,397 @@ async def send_tumbller_command(rover_id: str, command: str):
 
 
 # Utility Endpoints
+TRANSACTIONS_PAGE_SIZE = 50
+TRANSACTIONS_MAX_PAGE_SIZE = 500
+EXPORT_COLUMNS = ["id", "transaction_id", "user", "rover_id", "timestamp"]
+
+
+def _parse_cursor(cursor: Optional[str]) -> Optional[tuple]:
+    """Cursors are "<timestamp>:<id>" of the last row of the previous page"""
+    if not cursor:
+        return None
+    try:
+        timestamp, row_id = cursor.rsplit(":", 1)
+        return float(timestamp), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @app.get("/transactions")
-async def get_transactions(request: Request, db: Session = Depends(get_db)):
-    """View transaction history"""
-    transactions = db.query(Transaction).all()
+async def get_transactions(
+    request: Request,
+    rover_id: Optional[str] = None,
+    user: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    cursor: Optional[str] = None,
+    limit: int = TRANSACTIONS_PAGE_SIZE,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """View transaction history, one page at a time, newest first"""
+    limit = max(1, min(limit, TRANSACTIONS_MAX_PAGE_SIZE))
+    query = transactions_query(rover_id, user, since, until, _parse_cursor(cursor))
+    # One extra row tells whether there is a next page
+    transactions = (await db.execute(query.limit(limit + 1))).scalars().all()
+
+    next_url = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        last = transactions[-1]
+        params = {
+            key: value
+            for key, value in request.query_params.items()
+            if key != "cursor"
+        }
+        params["cursor"] = f"{last.timestamp!r}:{last.id}"
+        next_url = f"/transactions?{urllib.parse.urlencode(params)}"
+
+    # Exports cover what is listed: same filters, from the same page on
+    query_string = request.url.query
     return templates.TemplateResponse(
-        "transactions.html", {"request": request, "transactions": transactions}
+        "transactions.html",
+        {
+            "request": request,
+            "transactions": transactions,
+            "next_url": next_url,
+            "export_query": f"?{query_string}" if query_string else "",
+            "filters": {
+                "rover_id": rover_id or "",
+                "user": user or "",
+            },
+        },
+    )
+
+
+@app.get("/transactions/export.{fmt}")
+async def export_transactions(
+    fmt: str,
+    rover_id: Optional[str] = None,
+    user: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, gt=0),
+):
+    """
+    Stream matching transactions as NDJSON or CSV, without loading them all
+
+    Takes the query parameters of the history page, all pages from `cursor`
+    on are exported unless a `limit` is given.
+    """
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=404, detail="Unknown export format")
+    query = transactions_query(rover_id, user, since, until, _parse_cursor(cursor))
+    if limit is not None:
+        query = query.limit(limit)
+    query = query.execution_options(yield_per=500)
+
+    async def rows():
+        if fmt == "csv":
+            yield ",".join(EXPORT_COLUMNS) + "\r\n"
+        async with AsyncSessionLocal() as db:
+            # Server side cursor, rows are fetched in chunks as they are sent
+            result = await db.stream_scalars(query)
+            async for transaction in result:
+                values = [getattr(transaction, column) for column in EXPORT_COLUMNS]
+                if fmt == "csv":
+                    line = io.StringIO()
+                    csv.writer(line).writerow(values)
+                    yield line.getvalue()
+                else:
+                    yield json.dumps(dict(zip(EXPORT_COLUMNS, values))) + "\n"
+
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        rows(),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="transactions.{fmt}"'
+        },
     )
 
 
 @app.post("/{rover_id}/update_time/{mode}")
 async def update_time(rover_id: str, mode: str, request: Request):
     """Handle time update requests and return to the same frame"""
-    if not _validate_session(rover_id):
+    if not await _validate_session(rover_id):
         return await root(request)
 
-    if mode == "fb":
-        return templates.TemplateResponse(
-            "fb_control.html",
-            {
-                "request": request,
-                "fc_frame_image": f"/static/tumbllerImage.jpg",
-                "base_url": BASE_URL,
-                "rover_id": rover_id,
-                "time_left": rover_controls[rover_id].get_time_left(raw=True),
-                "end_url": "/v1",
-            },
+    # Refresh the countdown on the last camera frame, without asking the camera
+    with FRAME_RENDER_SECONDS.time("retime"):
+        variants = await frame_renderer.retime(
+            rover_id, rover_controls[rover_id].get_time_left()
         )
+    if variants:
+        push_frame(rover_id, variants)
+
+    if mode == "fb":
+        template_name = "fb_control.html"
     elif mode == "lr":
-        return templates.TemplateResponse(
-            "lr_control.html",
-            {
-                "request": request,
-                "fc_frame_image": f"/static/tumbllerImage.jpg",
-                "base_url": BASE_URL,
-                "rover_id": rover_id,
-                "time_left": rover_controls[rover_id].get_time_left(raw=True),
-                "end_url": "/v1",
-            },
-        )
+        template_name = "lr_control.html"
     else:
-        return templates.TemplateResponse(
-            "control_mode.html",
-            {
-                "request": request,
-                "fc_frame_image": f"/static/tumbllerImage.jpg",
-                "base_url": BASE_URL,
-                "rover_id": rover_id,
-                "time_left": rover_controls[rover_id].get_time_left(raw=True),
-                "end_url": "/v1",
-            },
-        )
+        template_name = "control_mode.html"
+    return shells.render(
+        template_name,
+        {
+            "request": request,
+            "fc_frame_image": get_image_url(BASE_URL, rover_id),
+            "base_url": BASE_URL,
+            "rover_id": rover_id,
+            "time_left": rover_controls[rover_id].get_time_left(raw=True),
+            "end_url": "/v1",
+        },
+    )
+
+
+@app.get("/v1/rover/{rover_id}/timer.png")
+async def get_timer(rover_id: str):
+    """Countdown of the current session alone, to overlay client side"""
+    if rover_id not in rover_controls:
+        raise HTTPException(status_code=404, detail="Unknown rover")
+    await rover_controls[rover_id].load()
+    return Response(
+        await frame_renderer.timer_png(rover_controls[rover_id].get_time_left()),
+        media_type="image/png",
+        headers={"Cache-Control": "no-store"},
+    )
 
 
 @app.get("/static/image/{rover_id}")
 async def get_image(rover_id: str, request: Request):
-    """Serve image with UUID parameter to prevent caching"""
-    image_path = Path(BASE_DIR, "static", f"image{rover_id}.jpg")
-    if not image_path.exists():
+    """
+    Serve the latest frame of a rover, or the default image before the first
+    one and while its camera is down
+
+    Clients revalidate it on every request, and get a 304 while no new frame
+    was taken.
+    """
+    if rover_id not in frame_buffers:
         raise HTTPException(status_code=404, detail="Image not found")
-    return FileResponse(image_path)
+    frame = latest_frame(rover_id)
+    if frame is None:
+        return FileResponse(DEFAULT_IMAGE, headers={"Cache-Control": "no-cache"})
+    etag = f'"{BOOT_ID}-{rover_id}-{frame.seq}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(frame.data, media_type="image/jpeg", headers=headers)
+
+
+@app.get("/v1/rover/{rover_id}/frame/{boot_id}/{seq}.jpg")
+async def get_frame(
+    rover_id: str,
+    boot_id: str,
+    seq: int,
+    request: Request,
+    size: str = FULL,
+    width: Optional[int] = Query(None, gt=0),
+):
+    """
+    Serve a buffered frame straight from memory, full size or as a thumbnail
+
+    Given the `width` the client displays it at, or when the client accepts
+    WebP, a smaller variant is encoded on the first request for it. With the
+    boot id of the process, a frame URL always refers to the same bytes, so
+    it is cached for good. Frames this process does not have, evicted or
+    captured by another worker, redirect to the latest one.
+    """
+    if rover_id not in frame_buffers:
+        raise HTTPException(status_code=404, detail="Unknown rover")
+    if size not in (FULL, THUMBNAIL):
+        raise HTTPException(status_code=400, detail="Invalid frame size")
+    frame = frame_buffers[rover_id].get(seq) if boot_id == BOOT_ID else None
+    if frame is None:
+        return latest_frame_redirect(rover_id, request)
+    accept = request.headers.get("accept", "")
+    format = WEBP if WEBP_FRAMES and "image/webp" in accept else JPEG
+    variant = snap_width(width) if width else size
+    etag = f'"{BOOT_ID}-{rover_id}-{seq}-{variant}-{format}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE, "Vary": "Accept"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    if width is None and format == JPEG:
+        data = frame.variants[size]
+    else:
+        data = await frame_variant(rover_id, frame, size, width, format)
+    return Response(data, media_type=MEDIA_TYPES[format], headers=headers)
+
+
+def latest_frame_redirect(rover_id: str, request: Request) -> RedirectResponse:
+    """Temporary redirect to the latest frame of a rover, same size and width"""
+    frame = latest_frame(rover_id)
+    if frame is None:
+        url = static_url("tumbllerImage.jpg")
+    else:
+        url = f"/v1/rover/{rover_id}/frame/{BOOT_ID}/{frame.seq}.jpg"
+        if request.url.query:
+            url += f"?{request.url.query}"
+    return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-store"})
+
+
+async def frame_variant(
+    rover_id: str, frame: Frame, size: str, width: Optional[int], format: str
+) -> bytes:
+    """A frame encoded again at a client width or format, kept with the frame"""
+    max_width = snap_width(width) if width else None
+    name = f"{format}-{max_width or size}"
+    if name not in frame.variants:
+        profile = EncodeProfile(
+            name,
+            quality=VARIANT_QUALITY,
+            max_width=max_width,
+            format=format,
+            progressive=PROGRESSIVE_JPEG,
+            max_bytes=VARIANT_MAX_BYTES or None,
+        )
+        source = frame.variants[FULL if max_width else size]
+        with FRAME_RENDER_SECONDS.time("variant"):
+            frame.variants[name] = await frame_renderer.variant(
+                (rover_id, frame.seq, name), source, profile
+            )
+    return frame.variants[name]
 
 
-def _validate_session(rover_id: str) -> bool:
-    """Validate if the session is still active"""
+@app.get("/v1/rover/{rover_id}/stream")
+async def get_stream(rover_id: str):
+    """Live MJPEG stream of a rover, open to players and spectators alike"""
+    if rover_id not in stream_relay:
+        raise HTTPException(status_code=404, detail="Unknown rover")
+
+    subscription = stream_relay.subscribe(rover_id)
+
+    async def frames():
+        try:
+            async for jpeg in subscription:
+                yield multipart_chunk(jpeg)
+        finally:
+            stream_relay.unsubscribe(rover_id, subscription)
+
+    return StreamingResponse(
+        frames(),
+        media_type=f"multipart/x-mixed-replace; boundary={MULTIPART_BOUNDARY}",
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+@app.get("/v1/rover/{rover_id}/state")
+async def get_rover_state(rover_id: str):
+    """The values of the control and waiting screens that change over time"""
+    if rover_id not in rover_controls:
+        raise HTTPException(status_code=404, detail="Unknown rover")
+    await rover_controls[rover_id].load()
+    return {
+        "rover_id": rover_id,
+        "available": rover_controls[rover_id].is_available(),
+        "time_left": rover_controls[rover_id].get_time_left(raw=True),
+        "fc_frame_image": get_image_url(BASE_URL, rover_id),
+        "healthy": health_monitor.is_healthy(rover_id),
+        "health": health_monitor[rover_id].as_dict(),
+    }
+
+
+@app.get("/v1/events")
+async def get_events(
+    request: Request, rover_id: Optional[str] = None, reservation: Optional[str] = None
+):
+    """
+    Server-Sent Events of one rover, or of all of them
+
+    Starts with a "state" event per rover, then sends "availability",
+    "session", "frame" and "queue" events as they happen. Waiters pass their
+    `reservation` to keep their place in the queue while connected.
+    """
+    if rover_id is not None and rover_id not in rover_controls:
+        raise HTTPException(status_code=404, detail="Unknown rover")
+    rover_ids = [rover_id] if rover_id else list(rover_controls)
+
+    subscription = event_hub.subscribe(rover_ids)
+    if rover_id and reservation:
+        reservations.attach(rover_id, reservation)
+    session_watcher.poke()
+
+    async def events():
+        try:
+            for followed in rover_ids:
+                rover = rover_controls[followed]
+                await rover.load()
+                yield Event(
+                    "state",
+                    {
+                        "rover_id": followed,
+                        "available": rover.is_available(),
+                        "time_left": rover.get_time_left(raw=True),
+                        **selection_state(followed),
+                    },
+                ).encode()
+            if rover_id and reservation:
+                yield Event("queue", {"rover_id": rover_id, **queue_state(rover_id)}).encode()
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.get(), timeout=EVENTS_KEEPALIVE
+                    )
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                yield event.encode()
+        finally:
+            event_hub.unsubscribe(rover_ids, subscription)
+            if rover_id and reservation:
+                reservations.detach(rover_id, reservation)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+Gauge(
+    "rover_session_active",
+    "Whether a rover is in session",
+    ["rover_id"],
+    collect=lambda: {
+        (rover_id,): int(not rover.is_available())
+        for rover_id, rover in rover_controls.items()
+    },
+)
+Gauge(
+    "frame_buffer_depth",
+    "Frames buffered in memory for a rover",
+    ["rover_id"],
+    collect=lambda: {(rover_id,): len(buffer) for rover_id, buffer in frame_buffers.items()},
+)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics of the hot paths"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+async def _validate_session(rover_id: str) -> bool:
+    """Validate if the session is still active, reading it for the request"""
     if rover_id not in rover_controls:
         return False
 
     rover = rover_controls[rover_id]
+    transaction_id = (await rover.load()).transaction_id
     if rover.is_available():
-        rover.clear_session()
+        # Only end the expired session, never one another worker just started:
+        # without a transaction id, the release would not be conditional
+        if transaction_id is not None:
+            await rover.clear_session(transaction_id)
         return False
 
     return True
 
 
+# Mounted after the routes, so that /static/image/{rover_id} is not shadowed
+app.mount("/static", static_files, name="static")
+
+
 if __name__ == "__main__":
     config = dict(
         app=app,
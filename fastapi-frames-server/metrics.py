@@ -0,0 +1,203 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds, in seconds, from a fast motor command to a slow PayCaster page
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric(ABC):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.register(self)
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+
+    @abstractmethod
+    def samples(self) -> List[str]: ...
+
+
+class Counter(Metric):
+    """
+    Monotonic count by label values
+
+    Like every metric here it is only updated from the event loop thread,
+    so plain dict updates need no lock.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_labels(self.labelnames, labels)} {value}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(Metric):
+    """Values read from `collect` when scraped, by label values"""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        collect: Optional[Callable[[], Dict[Tuple, float]]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        if self.collect is None:
+            return []
+        return [
+            f"{self.name}{_labels(self.labelnames, labels)} {value}"
+            for labels, value in self.collect().items()
+        ]
+
+
+class Histogram(Metric):
+    """Distribution of durations, in seconds, by label values"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # Label values -> [count per bucket, the last one being +Inf, sum]
+        self._values: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                extra = f'le="{le}"'
+                lines.append(
+                    f"{self.name}_bucket{_labels(self.labelnames, labels, extra)} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total[0]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CAMERA_FETCH_SECONDS = Histogram(
+    "camera_fetch_seconds", "Time to fetch a still image from a camera", ["rover_id"]
+)
+FRAME_RENDER_SECONDS = Histogram(
+    "frame_render_seconds",
+    "Time to decode, annotate and encode a frame with Pillow",
+    ["kind"],
+)
+MOTOR_COMMAND_SECONDS = Histogram(
+    "motor_command_seconds", "Round trip of a motor command", ["rover_id", "command"]
+)
+PAYCASTER_FETCH_SECONDS = Histogram(
+    "paycaster_fetch_seconds", "Time to fetch the PayCaster frame metadata"
+)
+WARPCAST_LOOKUP_SECONDS = Histogram(
+    "warpcast_lookup_seconds", "Time to resolve a FID to a username with Warpcast"
+)
+DB_COMMIT_SECONDS = Histogram(
+    "db_commit_seconds", "Time to commit a batch of transactions"
+)
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+
+
+class MetricsMiddleware:
+    """Counts requests by route template, plain ASGI to stay out of the way"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Mounts, like /static, only leave their path as the root path
+            route = scope.get("route")
+            path = getattr(route, "path", None) or scope.get("root_path") or "unmatched"
+            HTTP_REQUESTS.inc(scope["method"], path, str(status))
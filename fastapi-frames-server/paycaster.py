@@ -0,0 +1,175 @@
+import asyncio
+from html.parser import HTMLParser
+import logging
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import quote, quote_plus
+
+import httpx
+
+from metrics import PAYCASTER_FETCH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Meta tags of the PayCaster frame we use
+OG_IMAGE = "og:image"
+BUTTON_TARGET = "fc:frame:button:1:target"
+FRAME_TAGS = (OG_IMAGE, BUTTON_TARGET)
+
+
+class HeadMetaParser(HTMLParser):
+    """Collects <meta> tags and flags `done` once the <head> is over"""
+
+    def __init__(self, wanted: Iterable[str]):
+        super().__init__(convert_charrefs=True)
+        self.wanted = set(wanted)
+        self.meta: Dict[str, str] = {}
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            self.done = True
+        elif tag == "meta":
+            attributes = dict(attrs)
+            key = attributes.get("property") or attributes.get("name")
+            if key in self.wanted and key not in self.meta:
+                self.meta[key] = attributes.get("content")
+                if len(self.meta) == len(self.wanted):
+                    self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self.done = True
+
+
+class PayCasterClient:
+    """
+    Fetches the PayCaster payment frame and extracts the tags we embed
+
+    Only the page <head> is parsed, and at most `drain_limit` characters of
+    the rest are read so the connection can be reused. Results that do not
+    depend on the sender are cached per (rover_id, amount, token) for `ttl`
+    seconds, and can be kept warm in the background so later payers do not
+    wait for PayCaster.
+    """
+
+    def __init__(
+        self,
+        get_client: Callable[[], httpx.AsyncClient],
+        api_url: str,
+        api_key: str,
+        ttl: float = 300.0,
+        drain_limit: int = 64 * 1024,
+    ):
+        self._get_client = get_client
+        self.api_url = api_url
+        self.api_key = api_key
+        self.ttl = ttl
+        self.drain_limit = drain_limit
+        self._cache: Dict[Tuple[str, int, str], Tuple[Dict[str, str], float]] = {}
+        # Arguments of the request behind each entry, to refresh it with
+        self._requests: Dict[Tuple[str, int, str], Dict] = {}
+        self._prewarm_task: Optional[asyncio.Task] = None
+
+    async def frame_metadata(
+        self,
+        rover_id: str,
+        sender: str,
+        amount: int,
+        token: str,
+        receiver: str,
+        callback: str,
+        refresh: bool = False,
+    ) -> Dict[str, str]:
+        """Meta tags of the payment frame by name, e.g. "og:image" """
+        key = (rover_id, amount, token)
+        cached = self._cache.get(key)
+        if not refresh and cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+
+        query_params = {
+            "key": self.api_key,
+            "sender": sender,
+            "amount": amount,
+            "token": token,
+            "receiver": receiver,
+            "callback": callback,
+        }
+        with PAYCASTER_FETCH_SECONDS.time():
+            meta = await self._fetch(query_params)
+
+        if depends_on(sender, meta):
+            logger.debug(f"PayCaster frame of Rover {rover_id} depends on the sender")
+            self._cache.pop(key, None)
+            self._requests.pop(key, None)
+        else:
+            self._cache[key] = (meta, time.monotonic() + self.ttl)
+            self._requests[key] = dict(
+                rover_id=rover_id,
+                sender=sender,
+                amount=amount,
+                token=token,
+                receiver=receiver,
+                callback=callback,
+            )
+        return meta
+
+    async def _fetch(self, query_params: Dict) -> Dict[str, str]:
+        parser = HeadMetaParser(FRAME_TAGS)
+        drained = 0
+        async with self._get_client().stream(
+            "GET",
+            self.api_url,
+            params=query_params,
+            headers={
+                "Accept": "text/html,application/xhtml+xml",
+                "User-Agent": "Mozilla/5.0 FastAPI/0.95.0",
+            },
+        ) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_text():
+                if not parser.done:
+                    parser.feed(chunk)
+                    continue
+                # Past the limit, dropping the connection beats reading the page
+                drained += len(chunk)
+                if drained > self.drain_limit:
+                    break
+        return parser.meta
+
+    def start_prewarm(self, interval: Optional[float] = None):
+        """
+        Keep the cached frames warm
+
+        Entries are fetched again a bit before they expire, every `interval`
+        seconds, 80% of the TTL by default, with the arguments of the payer
+        whose request filled them.
+        """
+        interval = interval or self.ttl * 0.8
+        self._prewarm_task = asyncio.create_task(
+            self._prewarm(interval), name="paycaster-prewarm"
+        )
+
+    async def stop(self):
+        if self._prewarm_task is not None:
+            self._prewarm_task.cancel()
+            await asyncio.gather(self._prewarm_task, return_exceptions=True)
+            self._prewarm_task = None
+
+    async def _prewarm(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            for request in list(self._requests.values()):
+                try:
+                    await self.frame_metadata(**request, refresh=True)
+                except Exception as e:
+                    logger.warning(f"Could not pre-warm PayCaster frame: {e!r}")
+
+
+def depends_on(sender: str, meta: Dict[str, str]) -> bool:
+    """Whether `sender` shows up in the tags, as is or URL encoded"""
+    if not sender:
+        return False
+    forms = {sender, quote(sender, safe=""), quote_plus(sender)}
+    forms = {form.lower() for form in forms}
+    return any(form in (value or "").lower() for value in meta.values() for form in forms)
@@ -0,0 +1,212 @@
+from collections import OrderedDict
+import itertools
+import logging
+import secrets
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Reservation:
+    """
+    A place in the queue of a rover
+
+    The `ticket` number is public and shown to every waiter, the `token`
+    is only given to its holder and is what lets them claim the rover.
+    """
+
+    __slots__ = ("ticket", "token", "holder", "detached_at", "watchers")
+
+    def __init__(self, ticket: int, holder: Optional[str]):
+        self.ticket = ticket
+        self.token = secrets.token_urlsafe(16)
+        self.holder = holder
+        # Until its page listens, a reservation counts as gone since joining
+        self.detached_at: Optional[float] = time.monotonic()
+        self.watchers = 0
+
+
+class Claim:
+    __slots__ = ("reservation", "deadline")
+
+    def __init__(self, reservation: Reservation, deadline: float):
+        self.reservation = reservation
+        self.deadline = deadline
+
+
+class ReservationQueue:
+    """
+    First come, first served queues for busy rovers
+
+    When a rover frees up, the first waiter gets a claim: for `claim_window`
+    seconds only they can select it, then the claim moves on to the next
+    one. Waiters whose page has been gone for longer than `grace` seconds
+    are skipped. Queues live in process memory, like `MemorySessionStore`.
+    """
+
+    def __init__(
+        self,
+        claim_window: float = 45.0,
+        grace: float = 30.0,
+        on_change: Optional[Callable[[str], None]] = None,
+    ):
+        self.claim_window = claim_window
+        self.grace = grace
+        self.on_change = on_change
+        self._queues: Dict[str, "OrderedDict[str, Reservation]"] = {}
+        self._claims: Dict[str, Claim] = {}
+        self._tickets = itertools.count(1)
+
+    def _queue(self, rover_id: str) -> "OrderedDict[str, Reservation]":
+        return self._queues.setdefault(rover_id, OrderedDict())
+
+    def _changed(self, rover_id: str):
+        if self.on_change:
+            self.on_change(rover_id)
+
+    def join(
+        self, rover_id: str, holder: Optional[str] = None, token: Optional[str] = None
+    ) -> Reservation:
+        """Queue up, or keep the place already held with `token` or by `holder`"""
+        claim = self._claims.get(rover_id)
+        if claim and token and claim.reservation.token == token:
+            return claim.reservation
+        queue = self._queue(rover_id)
+        if token in queue:
+            return queue[token]
+        if holder:
+            for reservation in queue.values():
+                if reservation.holder == holder:
+                    return reservation
+        reservation = Reservation(next(self._tickets), holder)
+        queue[reservation.token] = reservation
+        logger.debug(f"Ticket {reservation.ticket} queued for Rover {rover_id}")
+        self._changed(rover_id)
+        return reservation
+
+    def leave(self, rover_id: str, token: str):
+        claim = self._claims.get(rover_id)
+        if claim and claim.reservation.token == token:
+            del self._claims[rover_id]
+        elif self._queue(rover_id).pop(token, None) is None:
+            return
+        self._changed(rover_id)
+
+    def attach(self, rover_id: str, token: str):
+        """The page of a waiter is listening for its turn"""
+        reservation = self._find(rover_id, token)
+        if reservation:
+            reservation.watchers += 1
+            reservation.detached_at = None
+
+    def detach(self, rover_id: str, token: str):
+        reservation = self._find(rover_id, token)
+        if reservation:
+            reservation.watchers = max(0, reservation.watchers - 1)
+            if not reservation.watchers:
+                reservation.detached_at = time.monotonic()
+
+    def _find(self, rover_id: str, token: str) -> Optional[Reservation]:
+        claim = self._claims.get(rover_id)
+        if claim and claim.reservation.token == token:
+            return claim.reservation
+        return self._queue(rover_id).get(token)
+
+    def position(self, rover_id: str, token: str) -> Optional[int]:
+        """1 for the next in line, 0 while holding the claim, None if not queued"""
+        claim = self._claims.get(rover_id)
+        if claim and claim.reservation.token == token:
+            return 0
+        for index, queued in enumerate(self._queue(rover_id)):
+            if queued == token:
+                return index + 1
+        return None
+
+    def held_by(self, rover_id: str, holder: Optional[str]) -> Optional[str]:
+        """Token of the claim on the rover when `holder` has it"""
+        claim = self._claims.get(rover_id)
+        if claim and holder and claim.reservation.holder == holder:
+            return claim.reservation.token
+        return None
+
+    def place_of(self, rover_id: str, holder: Optional[str]) -> Optional[Reservation]:
+        """The claim or place in the queue of `holder`, if they have one"""
+        if not holder:
+            return None
+        claim = self._claims.get(rover_id)
+        if claim and claim.reservation.holder == holder:
+            return claim.reservation
+        for reservation in self._queue(rover_id).values():
+            if reservation.holder == holder:
+                return reservation
+        return None
+
+    def tickets(self, rover_id: str) -> List[int]:
+        return [reservation.ticket for reservation in self._queue(rover_id).values()]
+
+    def claimant(self, rover_id: str) -> Optional[int]:
+        """Ticket of the waiter currently holding the claim on the rover"""
+        claim = self._claims.get(rover_id)
+        return claim.reservation.ticket if claim else None
+
+    def is_open(self, rover_id: str) -> bool:
+        """Nobody is waiting for nor claiming the rover"""
+        return rover_id not in self._claims and not self._queue(rover_id)
+
+    def may_take(self, rover_id: str, token: Optional[str]) -> bool:
+        """Whether a free rover can go to the holder of `token`, if any"""
+        claim = self._claims.get(rover_id)
+        if claim is not None:
+            return bool(token) and claim.reservation.token == token
+        return not self._queue(rover_id)
+
+    def update(self, rover_id: str, available: bool):
+        """
+        Hand the rover over when it is free
+
+        Called whenever its availability may have changed: a claim ends once
+        its window is over, then the next waiter still around gets one. The
+        claimant starting their session releases it, so a claim still held
+        while the rover is busy means a paid session took the rover first:
+        the claimant goes back to the head of the queue.
+        """
+        now = time.monotonic()
+        changed = False
+        claim = self._claims.get(rover_id)
+        if claim is not None:
+            if available and claim.deadline > now:
+                return
+            del self._claims[rover_id]
+            reservation = claim.reservation
+            if available:
+                logger.info(f"Ticket {reservation.ticket} let Rover {rover_id} go")
+            else:
+                queue = self._queue(rover_id)
+                queue[reservation.token] = reservation
+                queue.move_to_end(reservation.token, last=False)
+                logger.info(f"Ticket {reservation.ticket} is first in line again")
+            changed = True
+
+        queue = self._queue(rover_id)
+        while available and queue:
+            _, reservation = queue.popitem(last=False)
+            changed = True
+            if (
+                reservation.detached_at is not None
+                and now - reservation.detached_at > self.grace
+            ):
+                logger.debug(f"Ticket {reservation.ticket} left, skipping it")
+                continue
+            self._claims[rover_id] = Claim(reservation, now + self.claim_window)
+            logger.info(f"Ticket {reservation.ticket} may now take Rover {rover_id}")
+            break
+        if changed:
+            self._changed(rover_id)
+
+    def release(self, rover_id: str, token: Optional[str]):
+        """The holder of the claim started their session"""
+        claim = self._claims.get(rover_id)
+        if claim and token and claim.reservation.token == token:
+            del self._claims[rover_id]
+            self._changed(rover_id)
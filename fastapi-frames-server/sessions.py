@@ -0,0 +1,223 @@
+from abc import ABC, abstractmethod
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from database import RoverSession
+
+
+class SessionState:
+    """Snapshot of the session of a rover"""
+
+    __slots__ = ("transaction_id", "start_time", "user", "duration")
+
+    def __init__(
+        self,
+        transaction_id: Optional[str] = None,
+        start_time: float = 0,
+        user: Optional[str] = None,
+        duration: int = 0,
+    ):
+        self.transaction_id = transaction_id
+        self.start_time = start_time
+        self.user = user
+        self.duration = duration
+
+    def is_expired(self, now: float) -> bool:
+        if not self.transaction_id:
+            return True
+        return now - self.start_time > self.duration
+
+
+class SessionStore(ABC):
+    """
+    Where rover sessions live
+
+    `acquire` is a compare-and-set: it only starts a session when the rover
+    has none or its session expired, and tells whether it did.
+    """
+
+    @abstractmethod
+    async def get(self, rover_id: str) -> SessionState: ...
+
+    @abstractmethod
+    async def acquire(
+        self, rover_id: str, transaction_id: str, user: str, duration: int
+    ) -> bool: ...
+
+    @abstractmethod
+    async def release(self, rover_id: str, transaction_id: Optional[str] = None):
+        """End the session, only if it is still `transaction_id` when given"""
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions in process memory, only correct with a single worker"""
+
+    def __init__(self):
+        self._sessions: Dict[str, SessionState] = {}
+
+    async def get(self, rover_id: str) -> SessionState:
+        return self._sessions.get(rover_id) or SessionState()
+
+    async def acquire(
+        self, rover_id: str, transaction_id: str, user: str, duration: int
+    ) -> bool:
+        now = time.time()
+        if not (await self.get(rover_id)).is_expired(now):
+            return False
+        self._sessions[rover_id] = SessionState(transaction_id, now, user, duration)
+        return True
+
+    async def release(self, rover_id: str, transaction_id: Optional[str] = None):
+        state = self._sessions.get(rover_id)
+        if state and (transaction_id is None or state.transaction_id == transaction_id):
+            del self._sessions[rover_id]
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions in the `rover_sessions` table, shared by all uvicorn workers
+
+    Each operation is a single short statement in its own transaction, the
+    acquire being a conditional UPDATE so that two workers can never both
+    start a session on the same rover. They run on the async engine, so
+    waiting for the lock of another worker never blocks the event loop.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self._engine = engine
+
+    async def get(self, rover_id: str) -> SessionState:
+        async with self._engine.connect() as connection:
+            result = await connection.execute(
+                select(
+                    RoverSession.transaction_id,
+                    RoverSession.start_time,
+                    RoverSession.user,
+                    RoverSession.duration,
+                ).where(RoverSession.rover_id == rover_id)
+            )
+            row = result.first()
+        return SessionState(*row) if row else SessionState()
+
+    async def acquire(
+        self, rover_id: str, transaction_id: str, user: str, duration: int
+    ) -> bool:
+        now = time.time()
+        async with self._engine.begin() as connection:
+            await connection.execute(
+                insert(RoverSession)
+                .values(rover_id=rover_id, start_time=0, duration=0)
+                .on_conflict_do_nothing(index_elements=["rover_id"])
+            )
+            result = await connection.execute(
+                update(RoverSession)
+                .where(
+                    RoverSession.rover_id == rover_id,
+                    or_(
+                        RoverSession.transaction_id.is_(None),
+                        RoverSession.start_time + RoverSession.duration < now,
+                    ),
+                )
+                .values(
+                    transaction_id=transaction_id,
+                    user=user,
+                    start_time=now,
+                    duration=duration,
+                )
+            )
+        return result.rowcount == 1
+
+    async def release(self, rover_id: str, transaction_id: Optional[str] = None):
+        statement = update(RoverSession).where(RoverSession.rover_id == rover_id)
+        if transaction_id is not None:
+            statement = statement.where(RoverSession.transaction_id == transaction_id)
+        async with self._engine.begin() as connection:
+            await connection.execute(
+                statement.values(transaction_id=None, user=None, start_time=0)
+            )
+
+
+class RoverControl:
+    """
+    The session of a rover, as last read from its store
+
+    `load` reads it from the store, once per request, and the accessors only
+    look at that snapshot. Starting or clearing a session refreshes it.
+    """
+
+    def __init__(
+        self,
+        rover_id: str,
+        store: SessionStore,
+        session_duration: int,
+        on_change: Optional[Callable[[str], None]] = None,
+    ):
+        self.rover_id = rover_id
+        self.store = store
+        self.session_duration = session_duration
+        # Called with the rover id after a session starts or is cleared
+        self.on_change = on_change
+        self.state = SessionState()
+
+    async def load(self) -> SessionState:
+        self.state = await self.store.get(self.rover_id)
+        return self.state
+
+    @property
+    def transaction_id(self) -> Optional[str]:
+        return self.state.transaction_id
+
+    @property
+    def start_time(self) -> float:
+        return self.state.start_time
+
+    @property
+    def user(self) -> Optional[str]:
+        return self.state.user
+
+    def is_available(self) -> bool:
+        return self.state.is_expired(time.time())
+
+    async def start_session(self, transaction_id: str, user: str) -> bool:
+        """Start a session unless another one is running, returns whether it did"""
+        started = await self.store.acquire(
+            self.rover_id, transaction_id, user, self.session_duration
+        )
+        await self.load()
+        if started and self.on_change:
+            self.on_change(self.rover_id)
+        return started
+
+    def get_time_left(self, raw: bool = False) -> str | int:
+        """
+        Returns a formated string by default, e.g. 03:45
+
+        With `raw` set to True, returns the number of
+        seconds remaining, as an integer.
+        """
+        state = self.state
+        if not state.transaction_id:
+            if raw:
+                return 0
+            else:
+                return "00:00"
+        elapsed = time.time() - state.start_time
+        remaining = state.duration - elapsed
+        remaining = max(0, int(remaining))
+        if raw:
+            return remaining
+        else:
+            minutes = remaining // 60
+            seconds = remaining % 60
+            return f"{minutes:02d}:{seconds:02d}"
+
+    async def clear_session(self, transaction_id: Optional[str] = None):
+        """End the session, only if it is still `transaction_id` when given"""
+        await self.store.release(self.rover_id, transaction_id)
+        await self.load()
+        if self.on_change:
+            self.on_change(self.rover_id)
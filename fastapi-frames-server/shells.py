@@ -0,0 +1,90 @@
+from collections import OrderedDict
+import hashlib
+from typing import Any, Dict, Iterable, List, Tuple
+
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+from fastapi.templating import Jinja2Templates
+from markupsafe import escape
+
+
+class TemplateShells:
+    """
+    Pre-rendered templates with placeholders for the values of each request
+
+    A template is rendered once per combination of its static context values,
+    e.g. the rover id, with the `dynamic` values replaced by placeholders.
+    Later renders only join the cached parts with the dynamic values, escaped
+    the way Jinja escapes them.
+    Responses to GET and HEAD carry an ETag, and conditional ones get a 304.
+    """
+
+    def __init__(
+        self,
+        templates: Jinja2Templates,
+        dynamic: Iterable[str] = ("time_left", "fc_frame_image", "user_fid"),
+        max_size: int = 256,
+    ):
+        self.templates = templates
+        self.dynamic = tuple(dynamic)
+        self.max_size = max_size
+        self._shells: "OrderedDict[Tuple, List[str]]" = OrderedDict()
+
+    @staticmethod
+    def _placeholder(name: str) -> str:
+        # Nothing in it is escaped by Jinja, so it survives autoescaping as is
+        return f"@@shell:{name}@@"
+
+    def _shell(self, name: str, static: Dict[str, Any]) -> List[str]:
+        """Template split around placeholders, odd items are dynamic keys"""
+        key = (name, tuple(sorted(static.items())))
+        shell = self._shells.get(key)
+        if shell is not None:
+            self._shells.move_to_end(key)
+            return shell
+
+        context = dict(static)
+        context.update({key: self._placeholder(key) for key in self.dynamic})
+        rendered = self.templates.get_template(name).render(context)
+        shell = [rendered]
+        for dynamic_key in self.dynamic:
+            placeholder = self._placeholder(dynamic_key)
+            split = []
+            for index, part in enumerate(shell):
+                if index % 2:
+                    split.append(part)
+                    continue
+                pieces = part.split(placeholder)
+                split.append(pieces[0])
+                for piece in pieces[1:]:
+                    split.extend([dynamic_key, piece])
+            shell = split
+
+        self._shells[key] = shell
+        if len(self._shells) > self.max_size:
+            self._shells.popitem(last=False)
+        return shell
+
+    def render(self, name: str, context: Dict[str, Any]) -> Response:
+        """Drop-in for `Jinja2Templates.TemplateResponse(name, context)`"""
+        request: Request = context["request"]
+        static = {
+            key: value
+            for key, value in context.items()
+            if key != "request" and key not in self.dynamic
+        }
+        shell = self._shell(name, static)
+        body = "".join(
+            str(escape(context.get(part, ""))) if index % 2 else part
+            for index, part in enumerate(shell)
+        ).encode()
+
+        # Other methods, like the POSTs of frames, always get the page
+        if request.method not in ("GET", "HEAD"):
+            return HTMLResponse(body)
+
+        etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        return HTMLResponse(body, headers=headers)
@@ -0,0 +1,38 @@
+import logging
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """
+    Times the steps of the startup, until the app accepts requests
+
+    Each `mark` closes a step started at the previous one. The report is
+    logged as a warning when the whole startup took longer than `budget`
+    seconds, since with `--reload` every deploy waits for it.
+    """
+
+    def __init__(self, budget: float = 2.0, started_at: Optional[float] = None):
+        self.budget = budget
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.steps: List[Tuple[str, float]] = []
+        self._last = self.started_at
+
+    def mark(self, step: str):
+        now = time.perf_counter()
+        self.steps.append((step, now - self._last))
+        self._last = now
+
+    @property
+    def total(self) -> float:
+        return self._last - self.started_at
+
+    def log(self):
+        steps = ", ".join(f"{step} {elapsed * 1000:.0f}ms" for step, elapsed in self.steps)
+        message = f"Started in {self.total * 1000:.0f}ms: {steps}"
+        if self.total > self.budget:
+            logger.warning(f"{message}, over the budget of {self.budget:g}s")
+        else:
+            logger.info(message)
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Iterator
+
+import httpx
+
+from broadcast import Broadcast, Subscription
+
+logger = logging.getLogger(__name__)
+
+JPEG_START = b"\xff\xd8"
+JPEG_END = b"\xff\xd9"
+
+# Upper bound on bytes buffered while looking for the end of a frame
+MAX_FRAME_SIZE = 2 * 1024 * 1024
+
+MULTIPART_BOUNDARY = "frame"
+
+
+def split_jpegs(buffer: bytearray) -> Iterator[bytes]:
+    """
+    Pop every complete JPEG out of `buffer`, leaving any partial frame in it
+
+    The ESP-CAM multipart headers are ignored, frames are found by their
+    start and end of image markers.
+    """
+    while True:
+        start = buffer.find(JPEG_START)
+        if start < 0:
+            # Keep a trailing 0xff, it may be the first half of a marker
+            del buffer[: max(0, len(buffer) - 1)]
+            return
+        end = buffer.find(JPEG_END, start + 2)
+        if end < 0:
+            del buffer[:start]
+            if len(buffer) > MAX_FRAME_SIZE:
+                buffer.clear()
+            return
+        yield bytes(buffer[start : end + 2])
+        del buffer[: end + 2]
+
+
+def multipart_chunk(jpeg: bytes) -> bytes:
+    """Wrap a JPEG as one part of a multipart/x-mixed-replace response"""
+    header = (
+        f"--{MULTIPART_BOUNDARY}\r\n"
+        f"Content-Type: image/jpeg\r\n"
+        f"Content-Length: {len(jpeg)}\r\n\r\n"
+    )
+    return header.encode() + jpeg + b"\r\n"
+
+
+class StreamRelay:
+    """
+    Shares one upstream MJPEG connection per rover between all viewers
+
+    The upstream connection is opened with the first viewer and closed with
+    the last one. Each viewer gets a bounded queue, slow viewers skip frames.
+    Failed connections are retried after `reconnect_delay` seconds, doubled
+    after every failure in a row up to `max_reconnect_delay`.
+    """
+
+    def __init__(
+        self,
+        get_client: Callable[[], httpx.AsyncClient],
+        stream_urls: Dict[str, str],
+        queue_size: int = 2,
+        reconnect_delay: float = 2.0,
+        max_reconnect_delay: float = 30.0,
+    ):
+        self._get_client = get_client
+        self._stream_urls = stream_urls
+        self._queue_size = queue_size
+        self._reconnect_delay = reconnect_delay
+        self._max_reconnect_delay = max_reconnect_delay
+        self._broadcasts: Dict[str, Broadcast] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def __contains__(self, rover_id: str) -> bool:
+        return rover_id in self._stream_urls
+
+    def viewers(self, rover_id: str) -> int:
+        broadcast = self._broadcasts.get(rover_id)
+        return len(broadcast) if broadcast else 0
+
+    def subscribe(self, rover_id: str) -> Subscription:
+        broadcast = self._broadcasts.setdefault(rover_id, Broadcast(self._queue_size))
+        subscription = broadcast.subscribe()
+        task = self._tasks.get(rover_id)
+        # A pump that died unexpectedly is replaced, never reused
+        if task is None or task.done():
+            self._tasks[rover_id] = asyncio.create_task(
+                self._pump(rover_id, broadcast), name=f"stream-relay-{rover_id}"
+            )
+        return subscription
+
+    def unsubscribe(self, rover_id: str, subscription: Subscription):
+        broadcast = self._broadcasts.get(rover_id)
+        if broadcast is None:
+            return
+        broadcast.unsubscribe(subscription)
+        if not len(broadcast):
+            task = self._tasks.pop(rover_id, None)
+            if task is not None:
+                task.cancel()
+            logger.info(f"Last viewer left, closing stream of Rover {rover_id}")
+
+    async def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    async def _pump(self, rover_id: str, broadcast: Broadcast):
+        url = self._stream_urls[rover_id]
+        delay = self._reconnect_delay
+        while True:
+            try:
+                logger.info(f"Opening stream of Rover {rover_id} at {url}")
+                async with self._get_client().stream("GET", url) as response:
+                    response.raise_for_status()
+                    buffer = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        buffer += chunk
+                        for jpeg in split_jpegs(buffer):
+                            broadcast.publish(jpeg)
+                            delay = self._reconnect_delay
+                logger.warning(f"Stream of Rover {rover_id} ended, reconnecting")
+            except httpx.HTTPError as e:
+                logger.error(f"Stream error for Rover {rover_id}: {e}")
+            except Exception as e:
+                logger.exception(f"Unexpected stream error for Rover {rover_id}: {e}")
+            logger.debug(f"Reconnecting to Rover {rover_id} in {delay:g}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self._max_reconnect_delay)
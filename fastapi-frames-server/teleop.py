@@ -0,0 +1,195 @@
+import asyncio
+from collections import deque
+import logging
+import time
+from typing import Awaitable, Callable, Deque, Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Pre-empts the commands queued before it and is never dropped
+STOP = "stop"
+
+
+class QueuedCommand:
+    __slots__ = ("command", "deadline", "future")
+
+    def __init__(self, command: str, deadline: float):
+        self.command = command
+        self.deadline = deadline
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def resolve(self, success: bool, message: str):
+        if not self.future.done():
+            self.future.set_result((success, message))
+
+
+class CommandDispatcher:
+    """
+    Sends the motor commands of each rover one at a time, in order
+
+    Every rover has a worker task and a bounded queue, shared by all the
+    HTTP and WebSocket clients driving it. Commands still queued after their
+    deadline are dropped rather than replayed late, and a stop discards the
+    queue and cancels a command still in flight, so it never waits behind a
+    slow one.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str, str], Awaitable[Tuple[bool, str]]],
+        queue_size: int = 4,
+        deadline: float = 1.0,
+        timeout: float = 5.0,
+    ):
+        self._send = send
+        self.queue_size = queue_size
+        self.deadline = deadline
+        self.timeout = timeout
+        self._queues: Dict[str, Deque[QueuedCommand]] = {}
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._in_flight: Dict[str, Tuple[QueuedCommand, asyncio.Task]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.dropped = 0
+
+    def start(self, rover_ids: Iterable[str]):
+        for rover_id in rover_ids:
+            self._queues[rover_id] = deque()
+            self._wakeups[rover_id] = asyncio.Event()
+            self._tasks.add(
+                asyncio.create_task(
+                    self._run(rover_id), name=f"command-dispatcher-{rover_id}"
+                )
+            )
+        logger.info(f"Command dispatchers started for rovers: {', '.join(self._queues)}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        for queue in self._queues.values():
+            while queue:
+                queue.popleft().resolve(False, "Shutting down")
+
+    async def dispatch(
+        self, rover_id: str, command: str, deadline: Optional[float] = None
+    ) -> Tuple[bool, str]:
+        """Queue a command and wait until the rover got it, or it was dropped"""
+        queue = self._queues[rover_id]
+        queued = QueuedCommand(command, time.monotonic() + (deadline or self.deadline))
+        if command == STOP:
+            self._drop_all(queue, "Superseded by stop")
+            in_flight = self._in_flight.get(rover_id)
+            if in_flight is not None and in_flight[0].command != STOP:
+                in_flight[1].cancel()
+        elif len(queue) >= self.queue_size:
+            self._drop(queue.popleft(), "Dropped, too many commands")
+        queue.append(queued)
+        self._wakeups[rover_id].set()
+        return await asyncio.shield(queued.future)
+
+    def _drop(self, queued: QueuedCommand, message: str):
+        self.dropped += 1
+        queued.resolve(False, message)
+
+    def _drop_all(self, queue: Deque[QueuedCommand], message: str):
+        while queue:
+            self._drop(queue.popleft(), message)
+
+    async def _run(self, rover_id: str):
+        queue = self._queues[rover_id]
+        wakeup = self._wakeups[rover_id]
+        while True:
+            await wakeup.wait()
+            wakeup.clear()
+            while queue:
+                queued = queue.popleft()
+                if queued.command != STOP and queued.deadline < time.monotonic():
+                    self._drop(queued, "Expired before it could be sent")
+                    continue
+                await self._deliver(rover_id, queued)
+
+    async def _deliver(self, rover_id: str, queued: QueuedCommand):
+        task = asyncio.create_task(
+            asyncio.wait_for(self._send(rover_id, queued.command), self.timeout)
+        )
+        self._in_flight[rover_id] = (queued, task)
+        try:
+            queued.resolve(*await task)
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                # The dispatcher itself is stopping
+                task.cancel()
+                queued.resolve(False, "Shutting down")
+                raise
+            queued.resolve(False, "Superseded by stop")
+        except asyncio.TimeoutError:
+            queued.resolve(False, f"Tumbller {rover_id} not responding")
+        except Exception as e:
+            logger.error(f"Error sending {queued.command} command to Rover {rover_id}: {e}")
+            queued.resolve(False, "Command failed")
+        finally:
+            self._in_flight.pop(rover_id, None)
+
+
+class CommandCoalescer:
+    """
+    Sends the commands of a single driver one at a time, keeping only the latest
+
+    While a command is in flight, newer ones replace each other in a single
+    pending slot: when the rover lags, the presses in between are dropped
+    instead of being replayed late. A stop is sent right away.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[Tuple[bool, str]]],
+        on_result: Callable[[str, bool, str], Awaitable[None]],
+    ):
+        self._send = send
+        self._on_result = on_result
+        self._pending: Optional[str] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stops: Set[asyncio.Task] = set()
+        self.coalesced = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="command-coalescer")
+
+    async def stop(self):
+        tasks = list(self._stops)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def submit(self, command: str):
+        if self._pending is not None:
+            self.coalesced += 1
+        if command == STOP:
+            self._pending = None
+            task = asyncio.create_task(self._deliver(command))
+            self._stops.add(task)
+            task.add_done_callback(self._stops.discard)
+            return
+        self._pending = command
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            command, self._pending = self._pending, None
+            if command is not None:
+                await self._deliver(command)
+
+    async def _deliver(self, command: str):
+        try:
+            success, message = await self._send(command)
+        except Exception as e:
+            logger.error(f"Error sending {command} command: {e}")
+            success, message = False, "Command failed"
+        await self._on_result(command, success, message)
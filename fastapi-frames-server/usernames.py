@@ -0,0 +1,89 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from coalesce import coalesce
+from metrics import WARPCAST_LOOKUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class UsernameResolver:
+    """
+    Resolves Farcaster FIDs to usernames, with a bounded TTL + LRU cache
+
+    The blocking lookup runs with a timeout in a small pool of threads of its
+    own, so that a stalled Warpcast cannot tie up the default executor of the
+    event loop. Concurrent requests for the same FID share a single lookup,
+    and failed lookups are cached for `negative_ttl` seconds. Whenever no
+    username is known the FID itself is returned, as the handlers did before.
+    """
+
+    def __init__(
+        self,
+        lookup: Callable[[str], str],
+        max_size: int = 1024,
+        ttl: float = 3600.0,
+        negative_ttl: float = 60.0,
+        timeout: float = 2.0,
+        workers: int = 4,
+    ):
+        self._lookup = lookup
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # FID -> (username or None when the lookup failed, expiry time)
+        self._cache: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def start(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="username-lookup"
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, func: Callable[[], Any]) -> Any:
+        """Run `func` in a thread of the lookups"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func)
+
+    async def resolve(self, fid) -> str:
+        key = str(fid)
+        cached = self._cache.get(key)
+        if cached is not None:
+            username, expires = cached
+            if expires > time.monotonic():
+                self._cache.move_to_end(key)
+                return username or key
+            del self._cache[key]
+
+        return await coalesce(self._inflight, key, lambda: self._fetch(key))
+
+    async def _fetch(self, key: str) -> str:
+        try:
+            with WARPCAST_LOOKUP_SECONDS.time():
+                username = await asyncio.wait_for(
+                    self.run(lambda: self._lookup(key)), timeout=self.timeout
+                )
+            logger.info(f"Resolved FID {key} to username: {username}")
+            self._store(key, username, self.ttl)
+            return username
+        except Exception as e:
+            logger.error(f"Error getting username for FID {key}: {e!r}")
+            self._store(key, None, self.negative_ttl)
+            return key
+
+    def _store(self, key: str, username: Optional[str], ttl: float):
+        self._cache[key] = (username, time.monotonic() + ttl)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
@@ -0,0 +1,43 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def create_client(mnemonic: str, base_path: str, timeout: float):
+    """
+    Authenticated Warpcast client whose requests give up after `timeout` seconds
+
+    The SDK sets no timeout of its own, and authenticates with a bare
+    `requests.put` when created and again whenever its token expires. Both
+    the authentication and the API calls are given the timeout here. The SDK
+    and `requests` are only imported when called, they are slow to load.
+    """
+    from farcaster import Warpcast
+    from farcaster.models import AuthPutRequest, AuthPutResponse
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    default_timeout = timeout
+
+    class TimeoutAdapter(HTTPAdapter):
+        def send(self, request, timeout=None, **kwargs):
+            return super().send(request, timeout=timeout or default_timeout, **kwargs)
+
+    class TimedWarpcast(Warpcast):
+        def put_auth(self, auth_params):
+            header = self.generate_custody_auth_header(auth_params)
+            body = AuthPutRequest(params=auth_params)
+            response = requests.put(
+                self.config.base_path + "auth",
+                json=body.model_dump(by_alias=True, exclude_none=True),
+                headers={"Authorization": header},
+                timeout=default_timeout,
+            )
+            return AuthPutResponse(**response.json()).result
+
+    client = TimedWarpcast(mnemonic=mnemonic, base_path=base_path)
+    # Keep the retries of the SDK, but for reads that timed out: each one
+    # would hold the thread of the lookup for another `timeout` seconds
+    retries = client.session.get_adapter(base_path).max_retries
+    client.session.mount(base_path, TimeoutAdapter(max_retries=retries.new(read=0)))
+    return client